@@ -0,0 +1,6 @@
+import pandas as pd
+
+# Copy-on-Write: frames derived from a stored dataset share its memory until one of them
+# is modified, so services can take cheap shallow copies. Always on from pandas 3.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
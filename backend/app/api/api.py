@@ -2,22 +2,29 @@
 FastAPI application with improved security, validation, and error handling.
 Refactored to use modular services.
 """
-import uuid
+import os
 import io
-import json
+import hashlib
 import asyncio
 import numpy as np
-from typing import Dict, List
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+from typing import Dict, List, Optional
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Body, HTTPException, BackgroundTasks, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 
 # Import new services
 from app.core.config import settings
-from app.core.logger import get_logger
+from app.core.logger import setup_logger
 from app.core.validators import ChatRequest, ReplExecuteRequest, FileUploadValidator, sanitize_error_message
 from app.models.agent_state import AgentState
-from app.core.storage import DiskStore
+from app.core.storage import DiskStore, PREVIEW_CACHE_ROWS
+from app.core.ids import new_id
+from app.core.cache import llm_cache
+from app.core.serialization import ORJSONResponse, df_to_records, dumps
 
 from app.services.session_service import session_service
 from app.services.agent_service import agent_service
@@ -32,20 +39,63 @@ from app.services.reproducibility_service import reproducibility_service
 from app.local.model_router import get_agent_service, get_provider_status
 
 # Setup logging
-logger = get_logger()
+logger = setup_logger(
+    log_file=settings.log_file,
+    log_level=settings.log_level,
+    max_bytes=settings.log_max_bytes,
+    backup_count=settings.log_backup_count,
+)
 store = DiskStore(base_path=settings.data_store_path)
 
+# Rows serialized per chunk when streaming CSV downloads
+CSV_CHUNK_ROWS = 10_000
+
+# Preview limits
+MAX_PREVIEW_ROWS = 1000
+DEFAULT_PREVIEW_ROWS = PREVIEW_CACHE_ROWS  # what the frontend requests by default
+UNDO_COMMANDS = frozenset({"undo", "/undo"})
+
 
 async def cleanup_old_sessions():
     """Background task to clean up old sessions."""
     try:
-        cleaned = store.cleanup_old_sessions(max_age_hours=settings.session_ttl_hours)
+        cleaned = await store.acleanup_old_sessions(max_age_hours=settings.session_ttl_hours)
         if cleaned > 0:
             logger.info(f"Cleaned up {cleaned} old sessions")
     except Exception as e:
         logger.error(f"Session cleanup error: {e}")
 
 
+# Bounded worker pool for agent cycles (LLM calls + pandas work run in the threadpool)
+agent_queue: Optional[asyncio.Queue] = None
+agent_workers: List[asyncio.Task] = []
+
+
+async def agent_worker():
+    """Pull (agent, state, future) jobs off the queue and run them one at a time."""
+    while True:
+        agent, state, fut = await agent_queue.get()
+        try:
+            result = await run_in_threadpool(agent.run_cycle, state)
+            if not fut.done():
+                fut.set_result(result)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        finally:
+            agent_queue.task_done()
+
+
+async def run_agent_cycle(agent, state: AgentState) -> AgentState:
+    """Run an agent cycle through the worker pool, capping concurrent executions."""
+    if not agent_workers:
+        # Pool not started (app used without lifespan) -- run directly
+        return await run_in_threadpool(agent.run_cycle, state)
+    fut = asyncio.get_running_loop().create_future()
+    await agent_queue.put((agent, state, fut))
+    return await fut
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown tasks."""
@@ -55,10 +105,28 @@ async def lifespan(app: FastAPI):
     
     # Run initial cleanup
     await cleanup_old_sessions()
+
+    # Coalesce session writes in the background
+    session_service.start_flusher()
+
+    # Prune expired LLM cache entries in the background
+    llm_cache.start_janitor()
+
+    # Start agent worker pool
+    global agent_queue
+    agent_queue = asyncio.Queue()
+    for _ in range(settings.chat_workers):
+        agent_workers.append(asyncio.create_task(agent_worker()))
     
     yield
     
     logger.info("Shutting down InsightFlow AI API...")
+    for task in agent_workers:
+        task.cancel()
+    await asyncio.gather(*agent_workers, return_exceptions=True)
+    agent_workers.clear()
+    await session_service.stop_flusher()
+    llm_cache.stop_janitor()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -67,6 +135,7 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -84,7 +153,7 @@ logger.info(f"CORS configured with origins: {settings.allowed_origins}")
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": sanitize_error_message(exc.detail, safe_mode=True)}
     )
@@ -92,7 +161,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled error: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": sanitize_error_message(exc, safe_mode=True)}
     )
@@ -110,24 +179,21 @@ async def upload(
     """
     logger.info(f"Upload request: {file.filename} ({file.content_type})")
     
+    upload_path = None
     try:
-        # Validate file
-        content = await FileUploadValidator.validate_file(
+        # Validate while streaming to a temp file (CSV content is checked on the first chunk)
+        upload_path = await FileUploadValidator.spool_file(
             file,
             max_size_bytes=settings.max_file_size_bytes,
             allowed_types=settings.allowed_file_types
         )
         
-        # Additional CSV validation
-        if file.filename.endswith('.csv'):
-            FileUploadValidator.validate_csv_content(content)
-        
-        # Process upload via AgentService
+        # Process upload via AgentService (parsing is CPU-bound; keep it off the event loop)
         state = AgentState()
-        state = agent_service.upload(state, content, file.filename, description)
+        state = await run_in_threadpool(agent_service.upload, state, upload_path, file.filename, description)
         
         # Create session
-        session_id = str(uuid.uuid4())
+        session_id = new_id()
         session_service.save_session(session_id, state)
         
         if state.error:
@@ -138,17 +204,18 @@ async def upload(
         
         # Build preview
         try:
-            df = store.get_df(state.work_id)
-            preview_rows = store.sanitize_df(df).head(200).to_dict(orient='records')
+            df = await run_in_threadpool(store.get_df, state.work_id)
+            preview_rows = df_to_records(store.sanitize_df(df.head(200)))
             total_rows = len(df)
         except Exception as e:
             logger.warning(f"Preview generation failed: {e}")
             preview_rows = []
             total_rows = 0
             
-        # Schedule cleanup in background
+        # Schedule cleanup and preview cache warm-up in background
         if background_tasks:
             background_tasks.add_task(cleanup_old_sessions)
+            background_tasks.add_task(store.get_preview_bytes, state.work_id, DEFAULT_PREVIEW_ROWS)
         
         return {
             "sessionId": session_id,
@@ -164,26 +231,50 @@ async def upload(
     except Exception as e:
         logger.error(f"Upload error: {e}", exc_info=True)
         raise HTTPException(500, sanitize_error_message(e, safe_mode=True))
+    finally:
+        if upload_path is not None:
+            os.remove(upload_path)
+
+
+def preview_etag(work_id: str, limit: int) -> str:
+    """Datasets are immutable per work_id, so (work_id, limit) identifies a preview body."""
+    return '"' + hashlib.blake2b(f"{work_id}:{limit}".encode(), digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
 
 
 @app.get('/api/preview/{session_id}', summary="Get data preview", tags=["Data Management"])
-async def preview(session_id: str, limit: int = 1000):
+async def preview(session_id: str, request: Request, limit: int = 1000):
     """Get preview of uploaded data."""
     state = session_service.load_session(session_id)
     if not state or not state.work_id:
         raise HTTPException(404, "Session not found")
     
-    if limit > 1000: limit = 1000
+    if limit > MAX_PREVIEW_ROWS: limit = MAX_PREVIEW_ROWS
+    
+    # The session URL stays the same while work_id changes, so clients must revalidate
+    etag = preview_etag(state.work_id, limit)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=cache_headers)
     
     try:
-        df_safe = store.sanitize_df(store.get_df(state.work_id))
-        
-        if limit <= 0 or limit >= len(df_safe):
-            rows = df_safe.to_dict(orient='records')
-        else:
-            rows = df_safe.head(limit).to_dict(orient='records')
+        if limit > 0:
+            # Serialized preview is memoized per (work_id, limit); return it verbatim
+            rows_json = await run_in_threadpool(store.get_preview_bytes, state.work_id, limit)
+            return Response(content=b'{"rows":' + rows_json + b'}', media_type='application/json', headers=cache_headers)
+
+        # No sanitize pass over the full frame: orjson writes NaN/inf (and NaT/NA) as null
+        df = store.get_df(state.work_id)
+        rows = df_to_records(df)
         
-        return {"rows": rows}
+        return ORJSONResponse({"rows": rows}, headers=cache_headers)
         
     except Exception as e:
         logger.error(f"Preview error: {e}")
@@ -204,26 +295,71 @@ async def health():
     }
 
 
+def arrow_csv_table(df) -> Optional[pa.Table]:
+    """
+    Arrow table for CSV export with inf blanked (NaN already maps to null),
+    or None when a column cannot be converted (e.g. mixed-type object columns)
+    or is temporal, since Arrow formats datetimes differently from pandas.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowException, TypeError, ValueError):
+        return None
+    if any(pa.types.is_temporal(t) for t in table.schema.types):
+        return None
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            col = table.column(i)
+            table = table.set_column(i, field, pc.if_else(pc.is_inf(col), pa.scalar(None, field.type), col))
+    return table
+
+
 @app.get('/api/download/{session_id}', summary="Download dataset", tags=["Data Management"])
-async def download_csv(session_id: str):
-    """Download processed dataset as CSV."""
+async def download_csv(session_id: str, format: str = "csv"):
+    """Download processed dataset as CSV (default) or zstd-compressed Parquet."""
+    if format not in ("csv", "parquet"):
+        raise HTTPException(400, "format must be 'csv' or 'parquet'")
     state = session_service.load_session(session_id)
     if not state or not state.work_id:
         raise HTTPException(404, "Session not found")
     
     try:
         df = store.get_df(state.work_id)
-        df_safe = df.replace({np.nan: None, np.inf: None, -np.inf: None})
-        
-        buf = io.StringIO()
-        df_safe.to_csv(buf, index=False)
-        buf.seek(0)
-        
+
+        if format == "parquet":
+            buf = io.BytesIO()
+            await run_in_threadpool(df.to_parquet, buf, engine='pyarrow', compression='zstd', index=False)
+            headers = {
+                "Content-Disposition": f"attachment; filename=insightflow_data_{session_id[:8]}.parquet"
+            }
+            return Response(buf.getvalue(), media_type='application/vnd.apache.parquet', headers=headers)
+
+        table = await run_in_threadpool(arrow_csv_table, df)
+
+        def csv_chunks():
+            # Serialize in row batches so only one chunk of CSV text is held at a time.
+            # A plain generator, so StreamingResponse iterates it in the threadpool.
+            # Arrow's C++ writer encodes each batch; frames Arrow cannot represent go
+            # through pandas. NaN is written as an empty field; inf is blanked.
+            if table is not None:
+                batches = table.to_batches(max_chunksize=CSV_CHUNK_ROWS) or [table]
+                for i, batch in enumerate(batches):
+                    sink = pa.BufferOutputStream()
+                    pa_csv.write_csv(batch, sink, write_options=pa_csv.WriteOptions(include_header=(i == 0)))
+                    yield sink.getvalue().to_pybytes()
+                return
+            if len(df) == 0:
+                yield df.to_csv(index=False).encode()
+                return
+            for start in range(0, len(df), CSV_CHUNK_ROWS):
+                chunk = df.iloc[start:start + CSV_CHUNK_ROWS].replace([np.inf, -np.inf], np.nan)
+                yield chunk.to_csv(index=False, header=(start == 0)).encode()
+
         headers = {
             "Content-Disposition": f"attachment; filename=insightflow_data_{session_id[:8]}.csv"
         }
-        
-        return StreamingResponse(buf, media_type='text/csv', headers=headers)
+
+        return StreamingResponse(csv_chunks(), media_type='text/csv', headers=headers)
         
     except Exception as e:
         logger.error(f"Download error: {e}")
@@ -268,7 +404,7 @@ async def chat_stream(req: ChatRequest):
     async def event_generator():
         async for chunk_data in service.stream_execute(state):
             # Format as SSE
-            yield f"data: {json.dumps(chunk_data)}\n\n"
+            yield f"data: {dumps(chunk_data).decode()}\n\n"
             # Introduce slight pacing for natural feel
             if chunk_data.get("type") == "chunk":
                 await asyncio.sleep(0.02)
@@ -279,18 +415,14 @@ async def chat_stream(req: ChatRequest):
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
-def get_stats_local(wid):
-    """Helper to get dataframe info string."""
-    try:
-        from app.core.storage import DiskStore
-        from app.core.config import settings
-        store = DiskStore(base_path=settings.data_store_path)
-        d = store.get_df(wid)
-        buf = io.StringIO()
-        d.info(buf=buf)
-        return buf.getvalue()
-    except Exception:
-        return ""
+def get_stats_local(df) -> dict:
+    """Shape, dtypes and memory footprint of a dataframe, read straight from its attributes."""
+    return {
+        "rows": int(len(df)),
+        "cols": int(len(df.columns)),
+        "dtypes": {str(k): str(v) for k, v in df.dtypes.items()},
+        "mem_bytes": int(df.memory_usage(deep=False).sum())
+    }
 
 
 @app.post('/api/repl/{session_id}', summary="Execute Python code", tags=["Analysis"])
@@ -305,8 +437,8 @@ async def repl_execute(session_id: str, payload: dict = Body(...)):
         script = request.script
         
         # Execute code via separate execution service
-        df = store.get_df(state.work_id)
-        new_df, err, stdout = exec_code(script, df)
+        df = await run_in_threadpool(store.get_df, state.work_id)
+        new_df, err, stdout = await run_in_threadpool(exec_code, script, df)
         
         if err:
             logger.warning(f"REPL execution failed: {err}")
@@ -314,14 +446,14 @@ async def repl_execute(session_id: str, payload: dict = Body(...)):
         
         # Save result (update state)
         agent_service.push_undo(state, f"REPL: {script[:60]}...")
-        new_key = store.write_df(new_df)
+        new_key = await run_in_threadpool(store.write_df, new_df)
         state.work_id = new_key
         
         # PERSIST STATE
         session_service.save_session(session_id, state)
         
         # Prepare response
-        sample = store.sanitize_df(new_df).head(200).to_dict(orient='records')
+        sample = df_to_records(store.sanitize_df(new_df.head(200)))
         diff = compare_dataframes(df, new_df)
         
         msg = f"✅ Code executed successfully\n\n### Data Changes\n{diff}"
@@ -332,7 +464,7 @@ async def repl_execute(session_id: str, payload: dict = Body(...)):
             "type": "repl",
             "text": msg,
             "sample": sample,
-            "stats": get_stats_local(state.work_id)
+            "stats": get_stats_local(new_df)
         }
         
     except HTTPException:
@@ -434,7 +566,7 @@ async def process_data(action: str, session_id: str, payload: dict = Body(...)):
             "status": "success",
             "rows": len(new_df),
             "columns": len(new_df.columns),
-            "sample": store.sanitize_df(new_df).head(200).to_dict(orient='records'),
+            "sample": df_to_records(store.sanitize_df(new_df.head(200))),
             "report": report if 'report' in locals() else []
         }
 
@@ -454,18 +586,18 @@ async def undo_operation(session_id: str):
         # Agent service has undo logic built-in to handle pop/push
         state.next_node = "undo"
         active_agent = get_agent_service()
-        state = active_agent.run_cycle(state)
+        state = await run_agent_cycle(active_agent, state)
         
         # Save state
         session_service.save_session(session_id, state)
         
-        # Get new preview
-        df = store.get_df(state.work_id)
+        # Get new preview (the restored snapshot is often out of cache; read only its head)
+        _, total_rows = store.get_schema(state.work_id)
         return {
             "status": "success",
             "message": "Step reverted",
-            "rows": len(df),
-            "sample": store.sanitize_df(df).head(200).to_dict(orient='records')
+            "rows": total_rows,
+            "sample": df_to_records(store.sanitize_df(store.get_head(state.work_id, 200)))
         }
     except Exception as e:
         logger.error(f"Undo error: {e}")
@@ -489,10 +621,11 @@ async def generate_dashboard(session_id: str):
 
 
 @app.post("/api/dashboard/plotly/{session_id}", summary="Generate LLM Plotly dashboard", tags=["Dashboard"])
-async def generate_plotly_dashboard(session_id: str):
+async def generate_plotly_dashboard(session_id: str, regenerate: bool = False):
     """
     Ask the LLM to generate a complete, self-contained Plotly.js HTML dashboard
     tailored to the uploaded dataset. Returns {'html': '<full html string>'}.
+    Pass regenerate=true to bypass the cached dashboard for this data.
     """
     state = session_service.load_session(session_id)
     if not state or not state.work_id:
@@ -500,7 +633,7 @@ async def generate_plotly_dashboard(session_id: str):
 
     try:
         df = store.get_df(state.work_id)
-        html = llm_dashboard_service.generate(df)
+        html = llm_dashboard_service.generate(df, use_cache=not regenerate)
         return {"html": html}
     except Exception as e:
         logger.error(f"Plotly dashboard gen error: {e}", exc_info=True)
@@ -543,10 +676,11 @@ async def chat_endpoint(payload: dict = Body(...)):
         state.next_node = "human_input"
         
         # Command parsing
-        if text.lower() in ("undo", "/undo"):
+        command = text.lower()
+        if command in UNDO_COMMANDS:
             state.user_message = "Undo requested"
             state.next_node = "undo"
-        elif text.lower().startswith("/export"):
+        elif command.startswith("/export"):
             parts = text.split()
             if len(parts) > 1: state.export_filename = parts[1]
             state.next_node = "export"
@@ -556,7 +690,7 @@ async def chat_endpoint(payload: dict = Body(...)):
         
         # RUN AGENT CYCLE - Use model router
         active_agent = get_agent_service()
-        state = active_agent.run_cycle(state)
+        state = await run_agent_cycle(active_agent, state)
         
         # PERSIST STATE
         session_service.save_session(session_id, state)
@@ -622,9 +756,9 @@ async def generate_summary(session_id: str):
         if not state or not state.work_id:
             raise HTTPException(404, "Session not found or no data loaded")
         
-        # Get data stats
-        df = store.get_df(state.work_id)
-        stats_summary = f"Dataset with {len(df)} rows and {len(df.columns)} columns"
+        # Get data stats (shape only, from metadata)
+        columns, total_rows = store.get_schema(state.work_id)
+        stats_summary = f"Dataset with {total_rows} rows and {len(columns)} columns"
         
         # Generate summary using agent
         original_msg = state.user_message
@@ -634,7 +768,7 @@ async def generate_summary(session_id: str):
         
         # Run agent - Use model router
         active_agent = get_agent_service()
-        result_state = active_agent.run_cycle(state)
+        result_state = await run_agent_cycle(active_agent, state)
         
         # Parse response
         summary_text = result_state.user_message or "No insights available"
@@ -1,11 +1,22 @@
 """
-Simple in-memory cache for LLM responses with TTL support.
+Cache for LLM responses with TTL support (in memory, optionally backed
+by SQLite).
 """
+import os
 import time
-from typing import Optional, Any, Dict
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Set
 from hashlib import sha256
 from dataclasses import dataclass
 
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger()
+
 
 @dataclass
 class CacheEntry:
@@ -16,20 +27,26 @@ class CacheEntry:
 
 class SimpleCache:
     """
-    Simple in-memory cache with TTL (Time To Live).
+    Simple in-memory cache with TTL (Time To Live), bounded in size with
+    least-recently-used eviction.
     """
     
-    def __init__(self, default_ttl: int = 3600):
+    def __init__(self, default_ttl: int = 3600, max_entries: int = 1024):
         """
         Initialize cache.
         
         Args:
             default_ttl: Default time-to-live in seconds
+            max_entries: Maximum number of entries kept (least recently used are evicted)
         """
-        self._cache: Dict[str, CacheEntry] = {}
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
         self.default_ttl = default_ttl
+        self.max_entries = max_entries
         self._hits = 0
         self._misses = 0
+        self._janitor: Optional[threading.Thread] = None
+        self._janitor_stop = threading.Event()
     
     def _generate_key(self, *args, **kwargs) -> str:
         """
@@ -51,20 +68,26 @@ class SimpleCache:
         Returns:
             Cached value or None if not found/expired
         """
-        entry = self._cache.get(key)
-        
-        if entry is None:
-            self._misses += 1
-            return None
-        
-        # Check expiration
-        if time.time() > entry.expires_at:
-            del self._cache[key]
-            self._misses += 1
-            return None
-        
-        self._hits += 1
-        return entry.value
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            
+            if entry is None:
+                self._misses += 1
+                return None
+            
+            # Check expiration
+            if time.time() > entry.expires_at:
+                del self._cache[key]
+                self._misses += 1
+                return None
+            
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return entry.value
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """
@@ -76,9 +99,35 @@ class SimpleCache:
             ttl: Time-to-live in seconds (uses default if None)
         """
         ttl = ttl or self.default_ttl
-        expires_at = time.time() + ttl
+        entry = CacheEntry(value=value, expires_at=time.time() + ttl)
         
-        self._cache[key] = CacheEntry(value=value, expires_at=expires_at)
+        with self._lock:
+            self._remember(key, entry)
+            self._persist(key, entry)
+    
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        """Insert into the in-memory LRU (caller holds the lock)."""
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+    
+    # Hooks for a backing store; the in-memory cache has none
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        return None
+    
+    def _persist(self, key: str, entry: CacheEntry) -> None:
+        pass
+    
+    def _forget(self, key: str) -> bool:
+        return False
+    
+    def _forget_all(self) -> None:
+        pass
+    
+    def _purge_expired(self, now: float) -> Set[str]:
+        """Drop expired entries from the backing store; returns their keys."""
+        return set()
     
     def delete(self, key: str) -> bool:
         """
@@ -90,16 +139,17 @@ class SimpleCache:
         Returns:
             True if deleted, False if not found
         """
-        if key in self._cache:
-            del self._cache[key]
-            return True
-        return False
+        with self._lock:
+            in_memory = self._cache.pop(key, None) is not None
+            return self._forget(key) or in_memory
     
     def clear(self) -> None:
         """Clear all cache entries."""
-        self._cache.clear()
-        self._hits = 0
-        self._misses = 0
+        with self._lock:
+            self._cache.clear()
+            self._forget_all()
+            self._hits = 0
+            self._misses = 0
     
     def cleanup_expired(self) -> int:
         """
@@ -109,15 +159,48 @@ class SimpleCache:
             Number of entries removed
         """
         now = time.time()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if now > entry.expires_at
-        ]
+        with self._lock:
+            expired_keys = [
+                key for key, entry in self._cache.items()
+                if now > entry.expires_at
+            ]
+            
+            for key in expired_keys:
+                del self._cache[key]
+            purged = self._purge_expired(now)
         
-        for key in expired_keys:
-            del self._cache[key]
+        # A key is usually both in memory and on disk; count it once
+        return len(purged.union(expired_keys))
+    
+    def start_janitor(self, interval: Optional[float] = None) -> None:
+        """
+        Prune expired entries periodically in a daemon thread, so they do not pile
+        up between reads (get() still checks expiry on every hit).
+        
+        Args:
+            interval: Seconds between sweeps (default: a quarter of the default TTL)
+        """
+        if self._janitor is not None:
+            return
+        interval = interval or self.default_ttl / 4
+        self._janitor_stop.clear()
         
-        return len(expired_keys)
+        def run():
+            while not self._janitor_stop.wait(interval):
+                try:
+                    self.cleanup_expired()
+                except Exception as e:
+                    logger.error(f"Cache cleanup failed: {e}")
+        
+        self._janitor = threading.Thread(target=run, name="cache-janitor", daemon=True)
+        self._janitor.start()
+    
+    def stop_janitor(self) -> None:
+        """Stop the janitor thread, if running."""
+        thread, self._janitor = self._janitor, None
+        if thread is not None:
+            self._janitor_stop.set()
+            thread.join()
     
     def get_stats(self) -> dict:
         """
@@ -131,11 +214,74 @@ class SimpleCache:
         
         return {
             "size": len(self._cache),
+            "max_entries": self.max_entries,
             "hits": self._hits,
             "misses": self._misses,
             "hit_rate": round(hit_rate, 2)
         }
 
 
-# Global cache instance
-llm_cache = SimpleCache(default_ttl=3600)
+class PersistentCache(SimpleCache):
+    """
+    SimpleCache backed by a SQLite file, so cached LLM responses survive
+    restarts and are shared by workers on the same data directory.
+    The in-memory LRU stays in front of the file as a read cache.
+    """
+    
+    def __init__(self, db_path: str, default_ttl: int = 3600, max_entries: int = 1024):
+        """
+        Initialize cache.
+        
+        Args:
+            db_path: SQLite database file (created if missing)
+            default_ttl: Default time-to-live in seconds
+            max_entries: Maximum number of entries kept in memory
+        """
+        super().__init__(default_ttl=default_ttl, max_entries=max_entries)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._purge_expired(time.time())
+    
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        row = self._db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(value=pickle.loads(row[0]), expires_at=row[1])
+    
+    def _persist(self, key: str, entry: CacheEntry) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(entry.value, protocol=5), entry.expires_at)
+        )
+    
+    def _forget(self, key: str) -> bool:
+        return self._db.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount > 0
+    
+    def _forget_all(self) -> None:
+        self._db.execute("DELETE FROM cache")
+    
+    def _purge_expired(self, now: float) -> Set[str]:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            keys = {key for (key,) in self._db.execute("SELECT key FROM cache WHERE expires_at < ?", (now,))}
+            self._db.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return keys
+    
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        with self._lock:
+            stats["persisted"] = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return stats
+
+
+# Global cache instances
+llm_cache = PersistentCache(os.path.join(settings.data_store_path, "llm_cache.sqlite"), default_ttl=3600)
@@ -1,110 +1,162 @@
 """
 Configuration management for InsightFlow AI backend.
-Uses Pydantic for validated, type-safe settings.
+Settings are read once from the environment (and .env) into a slotted dataclass.
 """
 import os
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import List
-from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
 
-# Load environment variables (from backend root)
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env'))
+# .env in the backend root
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')
 
 
-class Settings(BaseModel):
-    """Application settings with validation."""
-    
+def _env_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(slots=True)
+class Settings:
+    """Application settings (mutable at runtime, e.g. when switching LLM provider)."""
+
     # API Keys
-    gemini_api_key: str = Field(..., env='GEMINI_API_KEY')
-    google_api_key: str = Field(default="", env='GOOGLE_API_KEY')
-    
+    gemini_api_key: str
+    google_api_key: str = ""
+
     # CORS
-    allowed_origins: List[str] = Field(
-        default=["http://localhost:3000", "http://localhost:5173"],
-        env='ALLOWED_ORIGINS'
-    )
-    
+    allowed_origins: List[str] = field(default_factory=lambda: ["http://localhost:3000", "http://localhost:5173"])
+
     # File Upload
-    max_file_size_mb: int = Field(default=1000, env='MAX_FILE_SIZE_MB')
-    allowed_file_types: List[str] = Field(
-        default=[".csv", ".json", ".xlsx"],
-        env='ALLOWED_FILE_TYPES'
-    )
-    
+    max_file_size_mb: int = 1000
+    allowed_file_types: List[str] = field(default_factory=lambda: [".csv", ".json", ".xlsx"])
+
     # Storage
-    data_store_path: str = Field(default="./data_store", env='DATA_STORE_PATH')
-    session_ttl_hours: int = Field(default=24, env='SESSION_TTL_HOURS')
-    
+    data_store_path: str = "./data_store"
+    session_ttl_hours: int = 24
+    session_cache_size: int = 1000
+    session_flush_interval_seconds: float = 0.25
+    session_redis_url: str = ""  # e.g. redis://localhost:6379/0
+    session_backend: str = "sqlite"  # local store when Redis is not used: 'sqlite' or 'disk'
+
     # LLM
-    llm_model: str = Field(default="gemini-2.5-flash-lite", env='LLM_MODEL')
-    llm_temperature: float = Field(default=0.7, env='LLM_TEMPERATURE')
-    llm_timeout_seconds: int = Field(default=30, env='LLM_TIMEOUT_SECONDS')
-    
+    llm_model: str = "gemini-2.5-flash-lite"
+    llm_temperature: float = 0.7
+    llm_timeout_seconds: int = 30
+    chat_workers: int = 4
+
     # LLM Provider Selection
-    llm_provider: str = Field(default="gemini", env='LLM_PROVIDER')  # 'gemini' or 'ollama'
-    ollama_base_url: str = Field(default="http://localhost:11434", env='OLLAMA_BASE_URL')
-    ollama_model: str = Field(default="kimi-k2.5:cloud", env='OLLAMA_MODEL')
-    
+    llm_provider: str = "gemini"  # 'gemini' or 'ollama'
+    ollama_base_url: str = "http://localhost:11434"
+    ollama_model: str = "kimi-k2.5:cloud"
+
     # Code Execution
-    code_exec_timeout_seconds: int = Field(default=5, env='CODE_EXEC_TIMEOUT_SECONDS')
-    max_code_length: int = Field(default=10000, env='MAX_CODE_LENGTH')
-    
+    code_exec_timeout_seconds: int = 5
+    max_code_length: int = 10000
+    max_stdout_chars: int = 1_000_000
+
     # Logging
-    log_level: str = Field(default="INFO", env='LOG_LEVEL')
-    log_file: str = Field(default="app.log", env='LOG_FILE')
-    log_max_bytes: int = Field(default=10_000_000, env='LOG_MAX_BYTES')
-    log_backup_count: int = Field(default=5, env='LOG_BACKUP_COUNT')
-    
+    log_level: str = "INFO"
+    log_file: str = "app.log"
+    log_max_bytes: int = 10_000_000
+    log_backup_count: int = 5
+
     # Server
-    host: str = Field(default="0.0.0.0", env='HOST')
-    port: int = Field(default=8000, env='PORT')
-    
+    host: str = "0.0.0.0"
+    port: int = 8000
+
     # Cache
-    enable_cache: bool = Field(default=True, env='ENABLE_CACHE')
-    cache_ttl_seconds: int = Field(default=3600, env='CACHE_TTL_SECONDS')
-    
-    @field_validator('allowed_origins', mode='before')
-    @classmethod
-    def parse_allowed_origins(cls, v):
+    enable_cache: bool = True
+    cache_ttl_seconds: int = 3600
+
+    @staticmethod
+    def parse_allowed_origins(v: str) -> List[str]:
         """Parse comma-separated origins from env var."""
-        if isinstance(v, str):
-            return [origin.strip() for origin in v.split(',')]
-        return v
-    
-    @field_validator('allowed_file_types', mode='before')
-    @classmethod
-    def parse_allowed_file_types(cls, v):
+        return [origin.strip() for origin in v.split(',')]
+
+    @staticmethod
+    def parse_allowed_file_types(v: str) -> List[str]:
         """Parse comma-separated file types from env var."""
-        if isinstance(v, str):
-            return [ft.strip() for ft in v.split(',')]
-        return v
-    
+        return [ft.strip() for ft in v.split(',')]
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from environment variables, falling back to the defaults above."""
+        defaults = cls(gemini_api_key="")
+        origins = os.getenv("ALLOWED_ORIGINS")
+        file_types = os.getenv("ALLOWED_FILE_TYPES")
+        return cls(
+            gemini_api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or "DUMMY_KEY",
+            google_api_key=_env_str("GOOGLE_API_KEY", defaults.google_api_key),
+            allowed_origins=cls.parse_allowed_origins(origins) if origins else defaults.allowed_origins,
+            max_file_size_mb=_env_int("MAX_FILE_SIZE_MB", defaults.max_file_size_mb),
+            allowed_file_types=cls.parse_allowed_file_types(file_types) if file_types else defaults.allowed_file_types,
+            data_store_path=_env_str("DATA_STORE_PATH", defaults.data_store_path),
+            session_ttl_hours=_env_int("SESSION_TTL_HOURS", defaults.session_ttl_hours),
+            session_cache_size=_env_int("SESSION_CACHE_SIZE", defaults.session_cache_size),
+            session_flush_interval_seconds=_env_float("SESSION_FLUSH_INTERVAL_SECONDS", defaults.session_flush_interval_seconds),
+            session_redis_url=_env_str("SESSION_REDIS_URL", defaults.session_redis_url),
+            session_backend=_env_str("SESSION_BACKEND", defaults.session_backend),
+            llm_model=_env_str("LLM_MODEL", defaults.llm_model),
+            llm_temperature=_env_float("LLM_TEMPERATURE", defaults.llm_temperature),
+            llm_timeout_seconds=_env_int("LLM_TIMEOUT_SECONDS", defaults.llm_timeout_seconds),
+            chat_workers=_env_int("CHAT_WORKERS", defaults.chat_workers),
+            llm_provider=_env_str("LLM_PROVIDER", defaults.llm_provider),
+            ollama_base_url=_env_str("OLLAMA_BASE_URL", defaults.ollama_base_url),
+            ollama_model=_env_str("OLLAMA_MODEL", defaults.ollama_model),
+            code_exec_timeout_seconds=_env_int("CODE_EXEC_TIMEOUT_SECONDS", defaults.code_exec_timeout_seconds),
+            max_code_length=_env_int("MAX_CODE_LENGTH", defaults.max_code_length),
+            max_stdout_chars=_env_int("MAX_STDOUT_CHARS", defaults.max_stdout_chars),
+            log_level=_env_str("LOG_LEVEL", defaults.log_level),
+            log_file=_env_str("LOG_FILE", defaults.log_file),
+            log_max_bytes=_env_int("LOG_MAX_BYTES", defaults.log_max_bytes),
+            log_backup_count=_env_int("LOG_BACKUP_COUNT", defaults.log_backup_count),
+            host=_env_str("HOST", defaults.host),
+            port=_env_int("PORT", defaults.port),
+            enable_cache=_env_bool("ENABLE_CACHE", defaults.enable_cache),
+            cache_ttl_seconds=_env_int("CACHE_TTL_SECONDS", defaults.cache_ttl_seconds),
+        )
+
     @property
     def api_key(self) -> str:
         """Get API key from either GEMINI_API_KEY or GOOGLE_API_KEY."""
         return self.gemini_api_key or self.google_api_key
-    
+
     @property
     def max_file_size_bytes(self) -> int:
         """Get max file size in bytes."""
         return self.max_file_size_mb * 1024 * 1024
-    
-    class Config:
-        env_file = '.env'
-        case_sensitive = False
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Get application settings singleton."""
+    """
+    Get application settings singleton (the .env file is read once per import of
+    this module; reloading the module starts a new cache and reads it again).
+    """
+    # Load environment variables (from backend root)
+    load_dotenv(ENV_FILE)
     try:
-        # Check if environment variables are set, fallback to empty string if not
-        gemini_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or "DUMMY_KEY"
-        return Settings(
-            gemini_api_key=gemini_key
-        )
+        return Settings.from_env()
     except Exception as e:
         print(f"Error loading settings: {e}")
-        # Return a partial settings object if possible, or re-raise
         raise RuntimeError(f"Failed to load application settings: {e}. Please check your .env file.")
 
 
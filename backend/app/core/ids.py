@@ -0,0 +1,30 @@
+"""
+Random identifier generation for sessions and stored datasets.
+IDs are UUID4 values as 32-char hex strings, drawn from a batched os.urandom pool.
+"""
+import os
+from collections import deque
+
+_ID_BATCH = 64
+_id_pool: deque = deque()
+
+# A forked worker must not hand out the same IDs as its parent
+os.register_at_fork(after_in_child=_id_pool.clear)
+
+
+def new_id() -> str:
+    """
+    Return a random UUID4 as 32 hex digits, like uuid.uuid4().hex. IDs issued before
+    the switch keep their dashed 8-4-4-4-12 form and remain valid keys.
+    """
+    try:
+        raw = _id_pool.popleft()
+    except IndexError:
+        raw = os.urandom(16 * _ID_BATCH)
+        _id_pool.extend(raw[i:i + 16] for i in range(16, len(raw), 16))
+        raw = raw[:16]
+    b = bytearray(raw)
+    # Set the version (4) and RFC 4122 variant bits
+    b[6] = (b[6] & 0x0F) | 0x40
+    b[8] = (b[8] & 0x3F) | 0x80
+    return b.hex()
@@ -2,10 +2,75 @@
 Structured logging configuration for InsightFlow AI.
 Provides consistent logging across the application.
 """
+import atexit
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Optional
+
+# Background thread that owns the file/console handlers (see setup_logger)
+_listener: Optional[QueueListener] = None
+
+# Log file write buffer and the longest a written record may sit in it
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 0.1
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that writes through a 64 KB buffer instead of flushing every
+    record. The buffer is flushed when full, when LOG_FLUSH_INTERVAL has passed since
+    the last flush, and when the listener goes idle (see _FlushingQueueListener).
+    """
+
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=LOG_BUFFER_BYTES,
+                      encoding=self.encoding, errors=self.errors)
+        # Track the file size ourselves: tell()/seek() would flush the buffer
+        self._size = os.fstat(stream.fileno()).st_size
+        self._last_flush = time.monotonic()
+        return stream
+
+    def shouldRollover(self, record) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self._size >= self.maxBytes
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            msg = self.format(record) + self.terminator
+            self.stream.write(msg)
+            self._size += len(msg)
+            if time.monotonic() - self._last_flush >= LOG_FLUSH_INTERVAL:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
+
+class _FlushingQueueListener(QueueListener):
+    """QueueListener that flushes its handlers whenever the queue has been idle for LOG_FLUSH_INTERVAL."""
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
 
 
 def setup_logger(
@@ -17,6 +82,8 @@ def setup_logger(
 ) -> logging.Logger:
     """
     Setup application logger with rotating file handler and console output.
+    Records are queued and written by a background listener thread, so callers
+    never block on disk I/O or log rotation.
     
     Args:
         name: Logger name
@@ -28,6 +95,7 @@ def setup_logger(
     Returns:
         Configured logger instance
     """
+    global _listener
     logger = logging.getLogger(name)
     
     # Prevent duplicate handlers
@@ -49,12 +117,14 @@ def setup_logger(
         datefmt='%H:%M:%S'
     )
     
+    handlers = []
+
     # File handler (rotating)
     try:
         log_path = Path(log_file)
         log_path.parent.mkdir(parents=True, exist_ok=True)
         
-        file_handler = RotatingFileHandler(
+        file_handler = BufferedRotatingFileHandler(
             log_file,
             maxBytes=max_bytes,
             backupCount=backup_count,
@@ -62,7 +132,7 @@ def setup_logger(
         )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(detailed_formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except Exception as e:
         print(f"Warning: Could not setup file logging: {e}")
     
@@ -70,7 +140,14 @@ def setup_logger(
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(simple_formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
+
+    # Request threads only enqueue; the listener does the actual writes
+    log_queue = queue.Queue(-1)
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = _FlushingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
     
     # Prevent propagation to root logger
     logger.propagate = False
@@ -0,0 +1,51 @@
+"""
+Fast JSON serialization helpers built on orjson.
+Shared by the API response class and on-disk caches.
+"""
+from typing import Any, Dict, List
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+
+def json_default(obj: Any) -> Any:
+    """Fallback for values orjson cannot encode natively (e.g. pd.Timestamp)."""
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    Serialize to JSON bytes. NaN/inf become null; numpy scalars/arrays are supported.
+    `indent` pretty-prints with two spaces (for text that goes into prompts).
+    """
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=json_default, option=option)
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from str or bytes (raises a ValueError subclass on invalid input)."""
+    return orjson.loads(data)
+
+
+def df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Equivalent of df.to_dict(orient='records'), built column-wise.
+    Each column is converted once with tolist() and rows are zipped together,
+    which avoids pandas' per-cell boxing on wide frames.
+    """
+    cols = df.columns.tolist()
+    data = [df.iloc[:, i].tolist() for i in range(df.shape[1])]
+    return [dict(zip(cols, row)) for row in zip(*data)]
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -2,98 +2,322 @@
 Disk-based storage for datasets with automatic cleanup and LRU caching.
 """
 import io
-import json
-import uuid
+import asyncio
 import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager, suppress
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
 from functools import lru_cache
 
+from app.core.serialization import df_to_records, dumps, loads
+from app.core.ids import new_id
+
+# Row count of the preview memoized on disk (the frontend's default request)
+PREVIEW_CACHE_ROWS = 1000
+
 class DiskStore:
     """Disk-based storage for dataframes with LRU caching."""
     
-    def __init__(self, base_path: str = "./data_store"):
+    # Frames are cached per data directory and shared by every DiskStore on it, so a
+    # frame written through one service's store is served from memory to the others.
+    _shared_caches: Dict[str, "OrderedDict[str, pd.DataFrame]"] = {}
+    _shared_recent: Dict[str, weakref.WeakValueDictionary] = {}
+    # Dataset metadata index (one SQLite connection per data directory and process)
+    _shared_indexes: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+    # Connections inherited through fork(); the child keeps them referenced but never
+    # uses or closes them (see _reset_after_fork)
+    _inherited_indexes: List[Tuple[sqlite3.Connection, threading.Lock]] = []
+    _cache_lock = threading.Lock()
+
+    def __init__(self, base_path: str = "./data_store", cache_limit: int = 8):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
-        self._cache: Dict[str, pd.DataFrame] = {}
-        self._cache_limit = 5
+        cache_id = self._cache_id = str(self.base_path.resolve())
+        with self._cache_lock:
+            self._cache = self._shared_caches.setdefault(cache_id, OrderedDict())
+            # Frames evicted from the LRU but still referenced elsewhere (e.g. by an
+            # in-flight request) stay reachable here until they are garbage collected
+            self._recent = self._shared_recent.setdefault(cache_id, weakref.WeakValueDictionary())
+        self._cache_limit = cache_limit
+        self._connection()
+
+    @classmethod
+    def _reset_after_fork(cls):
+        """
+        Runs in a forked child: locks may have been held by parent threads that do
+        not exist here, and SQLite connections must not be used across fork(), so
+        the child gets fresh locks and opens its own connections on first use.
+        Cached frames stay valid (keys are immutable) and are kept.
+        """
+        cls._cache_lock = threading.Lock()
+        cls._inherited_indexes.extend(cls._shared_indexes.values())
+        cls._shared_indexes = {}
+
+    def _connection(self) -> Tuple[sqlite3.Connection, threading.Lock]:
+        index = self._shared_indexes.get(self._cache_id)
+        if index is None:
+            with self._cache_lock:
+                index = self._shared_indexes.get(self._cache_id)
+                if index is None:
+                    index = self._shared_indexes[self._cache_id] = (self._open_index(), threading.Lock())
+        return index
+
+    @contextmanager
+    def _index(self):
+        """This process's metadata index connection, held exclusively for the block."""
+        db, lock = self._connection()
+        with lock:
+            yield db
+
+    def _open_index(self) -> sqlite3.Connection:
+        """
+        Open the metadata index (WAL mode), importing the per-dataset .meta.json
+        sidecar files written by earlier versions the first time.
+        """
+        db = sqlite3.connect(str(self.base_path / "datasets.sqlite"), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS datasets (key TEXT PRIMARY KEY, created_at REAL NOT NULL, "
+            "rows INTEGER NOT NULL, columns TEXT NOT NULL, size_bytes INTEGER NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS datasets_created_at ON datasets (created_at)")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if db.execute("SELECT 1 FROM meta WHERE key = 'sidecar_import'").fetchone():
+            return db
+
+        records = []
+        for meta_path in self.base_path.glob("*.meta.json"):
+            try:
+                metadata = loads(meta_path.read_bytes())
+                records.append((
+                    metadata["key"],
+                    datetime.fromisoformat(metadata["created_at"]).timestamp(),
+                    metadata["rows"],
+                    dumps(metadata["column_names"]).decode(),
+                    metadata["size_bytes"],
+                ))
+            except Exception:
+                continue
+        db.execute("BEGIN")
+        try:
+            db.executemany("INSERT OR IGNORE INTO datasets VALUES (?, ?, ?, ?, ?)", records)
+            db.execute("INSERT INTO meta (key, value) VALUES ('sidecar_import', ?)", (str(datetime.now().timestamp()),))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return db
+
+    def _cache_put_locked(self, key: str, df: pd.DataFrame):
+        self._cache[key] = df
+        self._cache.move_to_end(key)
+        self._recent[key] = df
+        while len(self._cache) > self._cache_limit:
+            self._cache.popitem(last=False)
+
+    def _cache_put(self, key: str, df: pd.DataFrame):
+        with self._cache_lock:
+            self._cache_put_locked(key, df)
+
+    def _cache_get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._cache_lock:
+            df = self._cache.get(key)
+            if df is not None:
+                self._cache.move_to_end(key)
+                return df
+            df = self._recent.get(key)
+            if df is not None:
+                self._cache_put_locked(key, df)
+            return df
 
     def sanitize_df(self, df: pd.DataFrame) -> pd.DataFrame:
         """Standardize dataframe for JSON serialization."""
         return df.replace({np.nan: None, np.inf: None, -np.inf: None})
 
     def write_df(self, df: pd.DataFrame) -> str:
-        key = str(uuid.uuid4())
-        data_path = self.base_path / f"{key}.parquet"
-        df.to_parquet(data_path, engine='pyarrow')
+        key = new_id()
+        data_path = self.base_path / f"{key}.feather"
+        feather.write_feather(df, data_path, compression='zstd', compression_level=3)
         
-        metadata = {
-            "key": key,
-            "created_at": datetime.now().isoformat(),
-            "rows": len(df),
-            "columns": len(df.columns),
-            "size_bytes": data_path.stat().st_size,
-            "column_names": list(df.columns)
-        }
-        meta_path = self.base_path / f"{key}.meta.json"
-        meta_path.write_text(json.dumps(metadata, indent=2))
+        with self._index() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?)",
+                (key, datetime.now().timestamp(), len(df), dumps(df.columns.tolist()).decode(), data_path.stat().st_size)
+            )
         
-        # Add to cache
-        self._cache[key] = df
-        if len(self._cache) > self._cache_limit:
-            self._cache.pop(next(iter(self._cache)))
+        # Add to cache: the next request usually reads back the frame it just wrote
+        self._cache_put(key, df)
             
         return key
 
+    def _data_path(self, key: str) -> Path:
+        """Path of a dataset on disk; datasets written before the Feather switch are parquet."""
+        data_path = self.base_path / f"{key}.feather"
+        if data_path.exists():
+            return data_path
+        return self.base_path / f"{key}.parquet"
+
+    def _preview_path(self, key: str) -> Path:
+        return self.base_path / f"{key}.preview.json"
+
+    def get_preview_bytes(self, key: str, limit: int) -> bytes:
+        """
+        Return the first `limit` rows of a dataset as a JSON array (bytes).
+        Keys are immutable, so the default-size preview is memoized on disk next to
+        the dataset; other limits are built on each call.
+        """
+        # dumps() writes NaN/inf/NaT as null, so the rows need no sanitize pass
+        if limit != PREVIEW_CACHE_ROWS:
+            return dumps(df_to_records(self.get_head(key, limit)))
+
+        preview_path = self._preview_path(key)
+        if preview_path.exists():
+            return preview_path.read_bytes()
+
+        payload = dumps(df_to_records(self.get_head(key, limit)))
+
+        # Concurrent requests may build the same preview: each writes its own temp file
+        # and the renames race harmlessly (the contents are identical)
+        fd, tmp_path = tempfile.mkstemp(dir=self.base_path, prefix=f"{key}.preview-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, preview_path)
+        except BaseException:
+            with suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        return payload
+
     def get_df(self, key: str) -> pd.DataFrame:
-        if key in self._cache:
-            return self._cache[key]
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
             
-        data_path = self.base_path / f"{key}.parquet"
+        data_path = self._data_path(key)
         if not data_path.exists():
             raise FileNotFoundError(f"No data found for key: {key}")
         
-        df = pd.read_parquet(data_path, engine='pyarrow')
-        self._cache[key] = df
+        if data_path.suffix == '.feather':
+            # Decompress straight from the mapped pages rather than read() into a buffer first
+            df = feather.read_feather(data_path, use_threads=True, memory_map=True)
+        else:
+            df = pq.read_table(data_path).to_pandas(self_destruct=True, split_blocks=True)
+        self._cache_put(key, df)
         return df
 
+    def get_head(self, key: str, n: int) -> pd.DataFrame:
+        """
+        First `n` rows of a dataset. On a cache miss only the leading record batches
+        (row groups for legacy parquet) are decoded, not the whole file.
+        """
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached.head(n)
+
+        data_path = self._data_path(key)
+        if not data_path.exists():
+            raise FileNotFoundError(f"No data found for key: {key}")
+
+        batches, rows = [], 0
+        if data_path.suffix == '.feather':
+            with pa.memory_map(str(data_path)) as source:
+                reader = pa.ipc.open_file(source)
+                schema = reader.schema
+                for i in range(reader.num_record_batches):
+                    if rows >= n:
+                        break
+                    batch = reader.get_batch(i)
+                    batches.append(batch)
+                    rows += batch.num_rows
+                table = pa.Table.from_batches(batches, schema=schema)
+        else:
+            pf = pq.ParquetFile(data_path)
+            for batch in pf.iter_batches(batch_size=max(n, 1)):
+                batches.append(batch)
+                break
+            table = pa.Table.from_batches(batches, schema=pf.schema_arrow)
+        return table.slice(0, n).to_pandas()
+
+    def get_schema(self, key: str) -> Tuple[List[str], int]:
+        """Column names and row count, from memory or the metadata index (no data is read)."""
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached.columns), len(cached)
+
+        with self._index() as db:
+            row = db.execute("SELECT columns, rows FROM datasets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No data found for key: {key}")
+        return loads(row[0]), row[1]
+
     def delete(self, key: str) -> bool:
-        data_path = self.base_path / f"{key}.parquet"
-        meta_path = self.base_path / f"{key}.meta.json"
         deleted = False
-        if data_path.exists():
-            data_path.unlink()
-            deleted = True
-        if meta_path.exists():
-            meta_path.unlink()
-            deleted = True
-        if key in self._cache:
-            del self._cache[key]
+        for data_path in (self.base_path / f"{key}.feather", self.base_path / f"{key}.parquet"):
+            if data_path.exists():
+                data_path.unlink()
+                deleted = True
+        with self._index() as db:
+            if db.execute("DELETE FROM datasets WHERE key = ?", (key,)).rowcount:
+                deleted = True
+        # Sidecar metadata from before the SQLite index
+        (self.base_path / f"{key}.meta.json").unlink(missing_ok=True)
+        # Serialized preview, plus temp files left by an interrupted preview write
+        for preview_path in self.base_path.glob(f"{key}.preview*"):
+            preview_path.unlink(missing_ok=True)
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._recent.pop(key, None)
         return deleted
 
+    def _expired_keys(self, cutoff: datetime) -> List[str]:
+        with self._index() as db:
+            rows = db.execute("SELECT key FROM datasets WHERE created_at < ?", (cutoff.timestamp(),)).fetchall()
+        return [key for (key,) in rows]
+
     def cleanup_old_sessions(self, max_age_hours: int = 24) -> int:
         cutoff = datetime.now() - timedelta(hours=max_age_hours)
-        cleaned = 0
-        for meta_file in self.base_path.glob("*.meta.json"):
-            try:
-                metadata = json.loads(meta_file.read_text())
-                if datetime.fromisoformat(metadata['created_at']) < cutoff:
-                    if self.delete(metadata['key']): cleaned += 1
-            except: continue
-        return cleaned
+        return sum(self.delete(key) for key in self._expired_keys(cutoff))
+
+    async def acleanup_old_sessions(self, max_age_hours: int = 24, max_concurrency: int = 32) -> int:
+        """Async cleanup: delete expired datasets concurrently in worker threads."""
+        cutoff = datetime.now() - timedelta(hours=max_age_hours)
+        keys = await asyncio.to_thread(self._expired_keys, cutoff)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def remove(key: str) -> bool:
+            async with semaphore:
+                return await asyncio.to_thread(self.delete, key)
+
+        results = await asyncio.gather(*(remove(k) for k in keys), return_exceptions=True)
+        return sum(1 for r in results if r is True)
 
     def list_all_keys(self) -> List[str]:
-        return [json.loads(f.read_text())['key'] for f in self.base_path.glob("*.meta.json") if f.exists()]
+        with self._index() as db:
+            return [key for (key,) in db.execute("SELECT key FROM datasets")]
 
     def get_stats(self) -> dict:
-        keys = self.list_all_keys()
-        total_bytes = sum(f.stat().st_size for f in self.base_path.glob("*.parquet"))
+        with self._index() as db:
+            count, total_bytes = db.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM datasets").fetchone()
         return {
-            "total_sessions": len(keys),
+            "total_sessions": count,
             "total_size_mb": round(total_bytes / (1024 * 1024), 2),
             "storage_path": str(self.base_path.absolute()),
             "cache_size": len(self._cache)
         }
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=DiskStore._reset_after_fork)
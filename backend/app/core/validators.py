@@ -5,7 +5,33 @@ Provides Pydantic models and validators for all API inputs.
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field, field_validator
 from fastapi import HTTPException, UploadFile
+import os
 import re
+import tempfile
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+SESSION_ID_RE = re.compile(r'[a-zA-Z0-9\-]{7,100}')
+
+DANGEROUS_SCRIPT_PATTERNS = (
+    'import os',
+    'import sys',
+    'import subprocess',
+    'import socket',
+    '__import__',
+    'eval(',
+    'exec(',
+    'compile(',
+    'open(',
+    'file(',
+)
+
+# Generic error messages for security
+SAFE_ERROR_MESSAGES = {
+    FileNotFoundError: 'Resource not found',
+    PermissionError: 'Access denied',
+    ValueError: 'Invalid input provided',
+    KeyError: 'Required field missing',
+}
 
 
 class ChatRequest(BaseModel):
@@ -21,10 +47,10 @@ class ChatRequest(BaseModel):
     @classmethod
     def validate_session_id(cls, v):
         """Validate session ID format (UUID-like)."""
-        if not v or len(v) < 7 or len(v) > 100:
-            raise ValueError('Invalid session ID length')
-        # Allow alphanumeric and hyphens only
-        if not re.match(r'^[a-zA-Z0-9\-]+$', v):
+        # Alphanumeric and hyphens only, 7-100 characters, in one anchored match
+        if not SESSION_ID_RE.fullmatch(v):
+            if not 7 <= len(v) <= 100:
+                raise ValueError('Invalid session ID length')
             raise ValueError('Session ID contains invalid characters')
         return v
     
@@ -43,21 +69,9 @@ class ReplExecuteRequest(BaseModel):
             raise ValueError('Script cannot be empty')
         
         # Check for obviously dangerous patterns
-        dangerous_patterns = [
-            'import os',
-            'import sys',
-            'import subprocess',
-            'import socket',
-            '__import__',
-            'eval(',
-            'exec(',
-            'compile(',
-            'open(',
-            'file(',
-        ]
-        
-        for pattern in dangerous_patterns:
-            if pattern in v.lower():
+        lowered = v.lower()
+        for pattern in DANGEROUS_SCRIPT_PATTERNS:
+            if pattern in lowered:
                 raise ValueError(f'Script contains forbidden pattern: {pattern}')
         
         return v
@@ -67,13 +81,16 @@ class FileUploadValidator:
     """Validator for file uploads."""
     
     @staticmethod
-    async def validate_file(
+    async def spool_file(
         file: UploadFile,
         max_size_bytes: int,
         allowed_types: List[str]
-    ) -> bytes:
+    ) -> str:
         """
-        Validate and read uploaded file.
+        Validate an upload while streaming it to a temporary file.
+        Only one chunk is held in memory, and oversized uploads are rejected
+        as soon as they cross the limit. CSV uploads are content-checked on
+        their first chunk.
         
         Args:
             file: Uploaded file
@@ -81,12 +98,11 @@ class FileUploadValidator:
             allowed_types: List of allowed file extensions
         
         Returns:
-            File content as bytes
+            Path of the temporary file (the caller removes it)
         
         Raises:
             HTTPException: If validation fails
         """
-        # Check file extension
         if not file.filename:
             raise HTTPException(400, "Filename is required")
         
@@ -97,39 +113,42 @@ class FileUploadValidator:
                 f"File type {file_ext} not allowed. Allowed types: {', '.join(allowed_types)}"
             )
         
-        # Read file content
-        content = await file.read()
-        
-        # Check file size
-        if len(content) > max_size_bytes:
-            size_mb = len(content) / (1024 * 1024)
-            max_mb = max_size_bytes / (1024 * 1024)
-            raise HTTPException(
-                413,
-                f"File too large ({size_mb:.1f}MB). Maximum size: {max_mb}MB"
-            )
-        
-        # Check if file is empty
-        if len(content) == 0:
-            raise HTTPException(400, "File is empty")
-        
-        return content
+        fd, path = tempfile.mkstemp(suffix=file_ext)
+        try:
+            size = 0
+            with os.fdopen(fd, 'wb') as tmp:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    if size == 0 and file_ext == '.csv':
+                        FileUploadValidator.validate_csv_head(chunk)
+                    size += len(chunk)
+                    if size > max_size_bytes:
+                        max_mb = max_size_bytes / (1024 * 1024)
+                        raise HTTPException(
+                            413,
+                            f"File too large (over {max_mb}MB). Maximum size: {max_mb}MB"
+                        )
+                    tmp.write(chunk)
+            
+            if size == 0:
+                raise HTTPException(400, "File is empty")
+            return path
+        except BaseException:
+            os.remove(path)
+            raise
     
     @staticmethod
-    def validate_csv_content(content: bytes) -> None:
+    def validate_csv_head(head: bytes) -> None:
         """
-        Basic validation of CSV content.
-        
-        Args:
-            content: CSV file content as bytes
-        
-        Raises:
-            HTTPException: If validation fails
+        Validate the leading bytes of a CSV upload: UTF-8 text with a header
+        and at least one data row. A multi-byte character cut off at the end of
+        the chunk is allowed.
         """
         try:
-            text = content.decode('utf-8')
-        except UnicodeDecodeError:
-            raise HTTPException(400, "File must be valid UTF-8 encoded text")
+            text = head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            if e.reason != 'unexpected end of data':
+                raise HTTPException(400, "File must be valid UTF-8 encoded text")
+            text = head[:e.start].decode('utf-8')
         
         lines = text.strip().split('\n')
         if len(lines) < 2:
@@ -148,15 +167,8 @@ def sanitize_error_message(error: Exception, safe_mode: bool = True) -> str:
         Sanitized error message
     """
     if safe_mode:
-        # Generic error messages for security
-        error_map = {
-            'FileNotFoundError': 'Resource not found',
-            'PermissionError': 'Access denied',
-            'ValueError': 'Invalid input provided',
-            'KeyError': 'Required field missing',
-        }
-        error_type = type(error).__name__
-        return error_map.get(error_type, 'An error occurred. Please try again.')
+        # Keyed by exact class, as the name lookup was (subclasses get the generic message)
+        return SAFE_ERROR_MESSAGES.get(type(error), 'An error occurred. Please try again.')
     else:
         # Development mode - show details
         return f"{type(error).__name__}: {str(error)}"
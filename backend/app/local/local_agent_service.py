@@ -1,5 +1,3 @@
-import json
-import re
 from typing import AsyncGenerator, Dict, Any
 from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage
@@ -9,7 +7,7 @@ from app.core.logger import get_logger
 from app.models.agent_state import AgentState
 from app.core.storage import DiskStore
 from app.services.execution_service import exec_code, compare_dataframes
-from app.services.base_agent import BaseAgentService
+from app.services.base_agent import BaseAgentService, extract_json
 from app.local.ollama_client import OllamaClient
 
 logger = get_logger()
@@ -45,11 +43,7 @@ class LocalAgentService(BaseAgentService):
             text = raw_response.content.strip()
             
             # Robust JSON extraction as a fallback
-            m = re.search(r'```json\s*(\{.*?\})\s*```', text, re.S) or re.search(r'(\{.*?\})', text, re.S)
-            if m:
-                res = json.loads(m.group(1))
-            else:
-                res = {"action": "answer", "content": text}
+            res = extract_json(text) or {"action": "answer", "content": text}
                 
         except Exception as e:
             logger.error(f"Ollama error: {e}")
@@ -220,11 +214,7 @@ class LocalAgentService(BaseAgentService):
                 yield {"type": "chunk", "text": content}
             
             # After stream completes, parse final JSON for tools
-            m = re.search(r'```json\s*(\{.*?\})\s*```', full_text, re.S) or re.search(r'(\{.*?\})', full_text, re.S)
-            if m:
-                res = json.loads(m.group(1))
-            else:
-                res = {"action": "answer", "content": full_text}
+            res = extract_json(full_text, last=True) or {"action": "answer", "content": full_text}
             
             # Execute action if present (essential for persistence)
             if isinstance(res, dict) and res.get("action") in ("auto_clean", "prepare_for_ml", "visualize", "transform"):
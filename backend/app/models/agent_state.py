@@ -1,24 +1,109 @@
-from typing import List, Optional, Literal, Dict, Any
-from pydantic import BaseModel, Field
+from dataclasses import dataclass, field, fields, replace
+from typing import List, Optional, Dict, Any, Tuple
 
-class UndoEntry(BaseModel):
+VALID_NODES = frozenset({"upload", "eda", "human_input", "execute", "undo", "export", "END"})
+
+
+_CONTAINERS = (dict, list)
+
+
+def _copy_json(value: Any) -> Any:
+    """Deep copy of plain JSON-like data (dicts/lists of scalars), without deepcopy's memo overhead."""
+    if type(value) is dict:
+        return {k: _copy_json(v) if type(v) in _CONTAINERS else v for k, v in value.items()}
+    if type(value) is list:
+        return [_copy_json(v) if type(v) in _CONTAINERS else v for v in value]
+    return value
+
+
+@dataclass(slots=True)
+class UndoEntry:
     description: str
     snapshot_key: str
-    transformation_report: List[Dict[str, Any]] = Field(default_factory=list)
+    transformation_report: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "description": self.description,
+            "snapshot_key": self.snapshot_key,
+            "transformation_report": _copy_json(self.transformation_report),
+        }
 
-class AgentState(BaseModel):
+
+@dataclass(slots=True)
+class AgentState:
     raw_id: str = ""
     work_id: str = ""
-    history: List[UndoEntry] = Field(default_factory=list)
-    next_node: Literal["upload", "eda", "human_input", "execute", "undo", "export", "END"] = "upload"
+    history: List[UndoEntry] = field(default_factory=list)
+    next_node: str = "upload"  # one of VALID_NODES
     user_message: str = ""
     error: Optional[str] = None
     export_filename: str = "cleaned.csv"
     retry_count: int = 0
     MAX_RETRIES: int = 3
     last_tool: Optional[dict] = None
-    chat_history: List[dict] = Field(default_factory=list)
+    chat_history: List[dict] = field(default_factory=list)
     persona: str = "Scientist"
-    transformation_report: List[Dict[str, Any]] = Field(default_factory=list)
+    transformation_report: List[Dict[str, Any]] = field(default_factory=list)
     dataset_description: str = ""
-    suggested_next_steps: List[str] = Field(default_factory=list)
+    suggested_next_steps: List[str] = field(default_factory=list)
+    # Rendered history tail: (history list, its length, n, text); not persisted
+    _history_tail: Optional[Tuple[list, int, int, str]] = field(default=None, init=False, repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain field dict (independent copy) for persistence; see from_dict()."""
+        data = {name: _copy_json(getattr(self, name)) for name in _STATE_FIELDS}
+        data["history"] = [entry.to_dict() for entry in self.history]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgentState":
+        """
+        Rebuild a state saved with to_dict(). Unknown keys are ignored and missing ones
+        take their defaults, so saved sessions survive model changes.
+        """
+        known = {k: v for k, v in data.items() if k in _STATE_FIELDS}
+        if known.get("next_node", "upload") not in VALID_NODES:
+            raise ValueError(f"Invalid next_node: {known['next_node']!r}")
+        known["history"] = [
+            entry if isinstance(entry, UndoEntry) else UndoEntry(
+                description=entry["description"],
+                snapshot_key=entry["snapshot_key"],
+                transformation_report=entry.get("transformation_report", []),
+            )
+            for entry in known.get("history", [])
+        ]
+        return cls(**known)
+
+    def clone(self) -> "AgentState":
+        """Independent deep copy (callers mutate the states they are handed)."""
+        return replace(
+            self,
+            history=[
+                UndoEntry(entry.description, entry.snapshot_key, _copy_json(entry.transformation_report))
+                for entry in self.history
+            ],
+            last_tool=_copy_json(self.last_tool),
+            chat_history=_copy_json(self.chat_history),
+            transformation_report=_copy_json(self.transformation_report),
+            suggested_next_steps=list(self.suggested_next_steps),
+        )
+
+    def history_tail(self, n: int = 4) -> str:
+        """Last `n` chat turns as "User: ..."/"AI: ..." lines, rendered once per history (retries reuse it)."""
+        cached = self._history_tail
+        if cached is not None and cached[0] is self.chat_history and cached[1:3] == (len(self.chat_history), n):
+            return cached[3]
+        lines = []
+        for msg in self.chat_history[-n:]:
+            role = "User" if msg.get("role") == "user" else "AI"
+            parts = msg.get("parts", [])
+            text = parts[0].get("text", "") if parts else msg.get("content", "")
+            lines.append(f"{role}: {text}\n")
+        text = "".join(lines)
+        self._history_tail = (self.chat_history, len(self.chat_history), n, text)
+        return text
+
+
+# Persisted fields (everything accepted by __init__)
+_STATE_FIELDS = frozenset(f.name for f in fields(AgentState) if f.init)
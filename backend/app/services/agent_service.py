@@ -1,8 +1,6 @@
-from typing import Any
-from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-import re
-import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict
 
 from app.core.config import settings
 from app.core.logger import get_logger
@@ -10,7 +8,7 @@ from app.models.agent_state import AgentState
 from app.core.storage import DiskStore
 from app.core.cache import llm_cache
 from app.services.execution_service import exec_code, compare_dataframes
-from app.services.base_agent import BaseAgentService
+from app.services.base_agent import BaseAgentService, extract_json
 from app.services.auto_clean_service import auto_clean_service
 from app.services.feature_engineer_service import feature_engineer_service
 
@@ -19,10 +17,26 @@ store = DiskStore(base_path=settings.data_store_path)
 
 class AgentService(BaseAgentService):
     def __init__(self):
-        self.llm = self._init_llm()
+        self._llm = None
+        self._llm_ready = False
+        self._llm_lock = threading.Lock()
+        # LLM calls in flight, by response cache key
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def llm(self):
+        """Gemini chat model, built on first use so app startup skips the client import."""
+        if not self._llm_ready:
+            with self._llm_lock:
+                if not self._llm_ready:
+                    self._llm = self._init_llm()
+                    self._llm_ready = True
+        return self._llm
 
     def _init_llm(self):
         try:
+            from langchain_google_genai import ChatGoogleGenerativeAI
             return ChatGoogleGenerativeAI(
                 model=settings.llm_model,
                 temperature=settings.llm_temperature,
@@ -39,18 +53,19 @@ class AgentService(BaseAgentService):
             state.next_node = "human_input"
             return state
 
-        prompt = self.build_prompt(state)
+        # Keyed on the request and dataset version, so a hit skips building the prompt at all
+        cache_key = self.response_cache_key(state)
         res = None
         if settings.enable_cache:
-            res = llm_cache.get(llm_cache._generate_key(prompt))
+            res = llm_cache.get(cache_key)
+        cached = res is not None
 
         if res is None:
             try:
-                raw = self.llm.invoke([HumanMessage(content=prompt)]).content.strip()
-                m = re.search(r'```json\s*(\{.*?\})\s*```', raw, re.S) or re.search(r'(\{.*?\})', raw, re.S)
-                res = json.loads(m.group(1)) if m else {"action": "answer", "content": raw}
                 if settings.enable_cache:
-                    llm_cache.set(llm_cache._generate_key(prompt), res, ttl=settings.cache_ttl_seconds)
+                    res = self._invoke_shared(cache_key, state)
+                else:
+                    res = self._invoke(state)
             except Exception as e:
                 logger.error(f"LLM error: {e}")
                 state.error = f"LLM Error: {str(e)}"
@@ -58,7 +73,48 @@ class AgentService(BaseAgentService):
                 state.next_node = "execute" if state.retry_count < state.MAX_RETRIES else "human_input"
                 return state
 
-        return self.handle_action(state, res)
+        # The response's own action decides the error state from here on
+        state.error = None
+        state = self.handle_action(state, res)
+        if settings.enable_cache:
+            # Only responses whose action succeeded are replayed; a failing script must
+            # not be served again for the rest of the TTL
+            if state.error:
+                if cached:
+                    llm_cache.delete(cache_key)
+            elif not cached:
+                llm_cache.set(cache_key, res, ttl=settings.cache_ttl_seconds)
+        return state
+
+    def _invoke(self, state: AgentState) -> dict:
+        prompt = self.build_prompt(state)
+        from langchain_core.messages import HumanMessage
+        raw = self.llm.invoke([HumanMessage(content=prompt)]).content.strip()
+        return extract_json(raw) or {"action": "answer", "content": raw}
+
+    def _invoke_shared(self, cache_key: str, state: AgentState) -> dict:
+        """
+        Call the LLM, or wait for an identical call already in flight (same cache key),
+        so a burst of duplicate requests costs one round trip. Errors reach every waiter.
+        """
+        with self._inflight_lock:
+            fut = self._inflight.get(cache_key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[cache_key] = Future()
+        if not owner:
+            return fut.result()
+
+        try:
+            res = self._invoke(state)
+            fut.set_result(res)
+            return res
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
 
     def handle_action(self, state: AgentState, res: dict) -> AgentState:
         try:
@@ -140,33 +196,14 @@ class AgentService(BaseAgentService):
         full_text = ""
         
         try:
+            from langchain_core.messages import HumanMessage
             async for chunk in self.llm.astream([HumanMessage(content=prompt)]):
                 content = chunk.content
                 full_text += content
                 yield {"type": "chunk", "text": content}
             
-            def extract_json(text):
-                # Try to find the last complete JSON block
-                # First, look for ```json ... ```
-                matches = list(re.finditer(r'```json\s*(\{.*?\})\s*```', text, re.S))
-                if matches:
-                    try: return json.loads(matches[-1].group(1))
-                    except: pass
-                
-                # Then look for bare { ... }
-                # We search from the end to find the most complete block
-                for i in range(len(text)-1, -1, -1):
-                    if text[i] == '}':
-                        for j in range(text.find('{'), i):
-                            if text[j] == '{':
-                                try:
-                                    # Try parsing this candidate block
-                                    return json.loads(text[j:i+1])
-                                except:
-                                    continue
-                return None
-
-            res = extract_json(full_text)
+            # The last complete JSON block wins
+            res = extract_json(full_text, last=True)
             if not res:
                 # If no JSON found, treat as simple answer
                 res = {"action": "answer", "content": full_text}
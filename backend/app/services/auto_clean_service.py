@@ -55,7 +55,7 @@ class AutoCleanService:
         """
         Automatically cleans data and returns (cleaned_df, report).
         """
-        df_clean = df.copy()
+        df_clean = df.copy(deep=False)
         profile = self.profile_data(df_clean)
         report = []
 
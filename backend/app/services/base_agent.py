@@ -1,20 +1,89 @@
 import io
-import json
 import re
 import pandas as pd
 import numpy as np
-from typing import Optional, List, Tuple, Dict, Any
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+import pyarrow.compute as pc
+from typing import Optional, List, Tuple, Dict, Any, Union
 from abc import ABC, abstractmethod
+from hashlib import sha256
 
 from app.core.config import settings
 from app.core.logger import get_logger
 from app.core.storage import DiskStore
 from app.models.agent_state import AgentState, UndoEntry
 from app.core.cache import llm_cache
+from app.core.serialization import df_to_records, dumps, loads
 
 logger = get_logger()
 store = DiskStore(base_path=settings.data_store_path)
 
+# Arrow CSV reader block size (also the schema-probe window)
+CSV_BLOCK_BYTES = 8 << 20
+# pandas.read_csv's default NA tokens, so the Arrow reader nulls the same cells
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+# Above this many columns the prompt lists dtype counts instead of every column
+MAX_INFO_COLUMNS = 50
+# Safety limit on node transitions per run_cycle call
+MAX_CYCLE_STEPS = 10
+
+# LLM replies: fenced ```json blocks, and the tokens that matter to the brace scan
+_JSON_FENCE_RE = re.compile(r"```json\s*(\{.*?\})\s*```", re.S)
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+
+def _balanced_objects(text: str) -> List[str]:
+    """
+    Every top-level {...} span in `text`, matched by brace depth in one pass
+    (braces inside string literals are ignored). No backtracking, so nested
+    objects are returned whole.
+    """
+    spans = []
+    depth, start, in_str, skip = 0, -1, False, -1
+    for m in _JSON_TOKEN_RE.finditer(text):
+        i = m.start()
+        if i == skip:
+            continue
+        ch = m.group()
+        if in_str:
+            if ch == "\\":
+                skip = i + 1
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = depth > 0
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                spans.append(text[start:i + 1])
+    return spans
+
+def extract_json(text: str, last: bool = False) -> Optional[dict]:
+    """
+    Parse the JSON object an LLM reply carries: a ```json block if present,
+    otherwise a bare {...} object. `last` prefers the final one (streamed replies
+    put their JSON at the end). Returns None when nothing parses to a dict.
+    """
+    fenced = _JSON_FENCE_RE.findall(text)
+    bare = [c for c in _balanced_objects(text) if c not in fenced]
+    if last:
+        fenced, bare = fenced[::-1], bare[::-1]
+    for candidate in fenced + bare:
+        try:
+            res = loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(res, dict):
+            return res
+    return None
+
 PERSONAS = {
     "Scientist": """You are an expert Data Scientist AI. 
 Focus on practical, clean, and executable analysis. Use standard libraries (pandas, numpy, etc.) effectively.
@@ -29,89 +98,100 @@ Focus on beautiful, intuitive charts and UX.
 Suggest the most aesthetic way to show data. Keep reasoning short and focus on the visual output."""
 }
 
+def _has_int64_overflow(column: pa.ChunkedArray) -> bool:
+    """True if a float column holds only whole numbers and one of them falls outside int64."""
+    valid = pc.drop_null(column)
+    if len(valid) == 0 or not pc.all(pc.equal(pc.floor(valid), valid)).as_py():
+        return False
+    bounds = pc.min_max(valid)
+    return bounds["max"].as_py() >= 2 ** 63 or bounds["min"].as_py() <= -2 ** 63
+
+
 class BaseAgentService(ABC):
     """Abstract base class for all agent services."""
     
-    def _get_stats(self, work_id: str) -> str:
-        if not work_id: return "No data."
+    def _compute_stats(self, df: pd.DataFrame) -> str:
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        cat_cols = df.select_dtypes(include=['object', 'category']).columns
+        
+        numeric_desc = df[numeric_cols].describe().to_string() if not numeric_cols.empty else "No numeric columns."
+        
+        cat_summary = ""
+        for col in cat_cols[:10]:
+            vc = df[col].value_counts().head(5).to_dict()
+            cat_summary += f"- {col}: {vc}\n"
+        
+        # Count nulls only in columns that have any (a cheaper pass over mostly complete data)
+        has_missing = df.isna().any()
+        missing_cols = has_missing.index[has_missing.to_numpy()]
+        missing = df[missing_cols].isna().sum().reindex(df.columns, fill_value=0)
+        missing_str = str(missing[missing > 0]) if missing.sum() > 0 else 'None'
+        
+        # Column/dtype/non-null listing (what df.info() prints, without its formatting pass).
+        # Wide frames get dtype counts only; missing values are already listed above.
+        if len(df.columns) <= MAX_INFO_COLUMNS:
+            info = "\n".join(
+                f"{col}: {dtype} ({len(df) - n_missing} non-null)"
+                for col, dtype, n_missing in zip(df.columns, df.dtypes, missing.tolist())
+            )
+        else:
+            info = ", ".join(f"{dtype}: {count}" for dtype, count in df.dtypes.astype(str).value_counts().items())
+        memory_kb = int(df.memory_usage(deep=False).sum()) // 1024
+        
+        return f"Shape: {df.shape}\nMissing Values:\n{missing_str}\n\nNumeric Summary:\n{numeric_desc}\n\nCategorical Top Values:\n{cat_summary}\n\nInfo:\n{info}\nMemory: {memory_kb} KB"
+
+    def _load_context(self, work_id: str, n: int = 3) -> Tuple[List[str], List[dict], str]:
+        """
+        Columns, an n-row sample and the stats text for a dataset, from a single read.
+        A work_id names an immutable snapshot, so the result is cached per work_id.
+        """
+        if not work_id: return [], [], "No data."
         
-        # Cache stats per work_id
-        cache_key = f"stats_{work_id}"
+        cache_key = f"context_{work_id}_{n}"
         cached = llm_cache.get(cache_key)
         if cached: return cached
 
         try:
             df = store.get_df(work_id)
-            buf = io.StringIO()
-            df.info(buf=buf)
-            
-            numeric_cols = df.select_dtypes(include=[np.number]).columns
-            cat_cols = df.select_dtypes(include=['object', 'category']).columns
-            
-            numeric_desc = df[numeric_cols].describe().to_string() if not numeric_cols.empty else "No numeric columns."
-            
-            cat_summary = ""
-            for col in cat_cols[:10]:
-                vc = df[col].value_counts().head(5).to_dict()
-                cat_summary += f"- {col}: {vc}\n"
-            
-            missing = df.isna().sum()
-            missing_str = str(missing[missing > 0]) if missing.sum() > 0 else 'None'
-            
-            stats_text = f"Shape: {df.shape}\nMissing Values:\n{missing_str}\n\nNumeric Summary:\n{numeric_desc}\n\nCategorical Top Values:\n{cat_summary}\n\nInfo:\n{buf.getvalue()}"
-            
-            llm_cache.set(cache_key, stats_text, ttl=3600)
-            return stats_text
         except Exception as e:
-            logger.error(f"Stats error for {work_id}: {e}")
-            return f"Stats error: {e}"
-
-    def _get_schema_sample(self, work_id: str, n: int = 3) -> Tuple[List[str], List[dict]]:
+            logger.error(f"Error loading dataset context for {work_id}: {e}")
+            return [], [], f"Stats error: {e}"
+        
+        cols = list(df.columns)
+        # NaN/inf need no sanitizing pass: dumps() writes them as null
+        sample = df_to_records(df.head(n))
         try:
-            df = store.get_df(work_id)
-            df_safe = df.replace({np.nan: None, np.inf: None, -np.inf: None})
-            return list(df_safe.columns), df_safe.head(n).to_dict(orient='records')
+            stats = self._compute_stats(df)
         except Exception as e:
-            logger.error(f"Error getting schema sample: {e}")
-            return [], []
-
-    def build_prompt(self, state: AgentState) -> str:
-        cols, sample = self._get_schema_sample(state.work_id, n=3)
-        stats = self._get_stats(state.work_id)
-        persona = PERSONAS.get(state.persona, PERSONAS["Scientist"])
+            logger.error(f"Stats error for {work_id}: {e}")
+            return cols, sample, f"Stats error: {e}"
         
-        # Dataset Context Enhancement
-        context_description = ""
-        if state.dataset_description:
-            context_description = f"\nUSER PROVIDED DATASET DESCRIPTION/GOAL:\n{state.dataset_description}\n"
-
-        history = ""
-        if state.chat_history:
-            for msg in state.chat_history[-4:]:
-                role = "User" if msg.get("role") == "user" else "AI"
-                parts = msg.get("parts", [])
-                text = parts[0].get("text", "") if parts else msg.get("content", "")
-                history += f"{role}: {text}\n"
+        context = (cols, sample, stats)
+        llm_cache.set(cache_key, context, ttl=3600)
+        return context
 
-        return f"""{persona}
+    def build_prompt_parts(self, state: AgentState) -> Tuple[str, str]:
+        """
+        Split the prompt into a stable part (persona, instructions, response format),
+        which is identical across turns, and a volatile part (dataset context,
+        request, recent history). The stable part goes first so providers can
+        reuse it as a cached prefix.
+        """
+        persona = PERSONAS.get(state.persona, PERSONAS["Scientist"])
+        static = f"""{persona}
 
-DATASET CONTEXT:
-{stats}
-SCHEMA SAMPLE: {json.dumps(sample, default=str)}
-{context_description}
 INSTRUCTIONS:
 You are a professional data engine. Solve the request below.
 - Keep output CONCISE. Do not include boilerplate or extra analysis unless asked.
 - CODE STYLE: Use "Minimum Viable Code".
 - **CRITICAL**: The dataframe is already loaded and available as a variable named `df`.
 - **STRICTLY FORBIDDEN**: Do NOT use `pd.read_csv`, `pd.read_json`, or any I/O functions. Work directly on the existing `df`.
+- **NO IMPORTS**: Do not use `import`. `pd`, `np`, `sklearn` (and `preprocessing`, `linear_model`, `cluster`, `metrics`, `decomposition`, `ensemble`, `manifold`), `scipy`, `sm`, `datetime`, `math`, `re` and `statistics` are preloaded.
 - **TRANSFORMATIONS**: For feature engineering (creating columns, scaling, etc.), use "action": "code".
 - If you need to visualize, use "action": "visualize".
 - FOR OUTPUT: You MUST return a JSON block at the VERY END.
 - Include 3-4 "suggested_next_steps" (as strings) relevant to the data and goal.
 
-USER REQUEST: {state.user_message}
-{history}
 RESPONSE FORMAT (JSON):
 {{
     "reasoning": "Direct technical rationale.",
@@ -131,18 +211,67 @@ IMPORTANT:
 - Use "visualize" to show a chart.
 """
 
+        cols, sample, stats = self._load_context(state.work_id, n=3)
+        
+        # Dataset Context Enhancement
+        context_description = ""
+        if state.dataset_description:
+            context_description = f"\nUSER PROVIDED DATASET DESCRIPTION/GOAL:\n{state.dataset_description}\n"
+
+        history = state.history_tail(4)
+
+        dynamic = f"""
+DATASET CONTEXT:
+{stats}
+SCHEMA SAMPLE: {dumps(sample).decode()}
+{context_description}
+USER REQUEST: {state.user_message}
+{history}"""
+        return static, dynamic
+
+    def build_prompt(self, state: AgentState) -> str:
+        static, dynamic = self.build_prompt_parts(state)
+        return static + dynamic
+
+    def response_cache_key(self, state: AgentState) -> str:
+        """
+        Cache key for an LLM response: the request itself, the assistant turn it
+        answers (so follow-ups like "yes, do it" depend on what was proposed) and the
+        exact dataset version (work_id also pins columns, dtypes and shape). Older
+        history and prompt wording are left out so repeated requests hit.
+        """
+        key_str = "|".join([
+            state.user_message or "",
+            self._last_assistant_turn(state),
+            state.persona or "",
+            state.dataset_description or "",
+            state.work_id or ""
+        ])
+        return sha256(key_str.encode()).hexdigest()
+
+    @staticmethod
+    def _last_assistant_turn(state: AgentState) -> str:
+        for msg in reversed(state.chat_history):
+            if msg.get("role") != "user":
+                parts = msg.get("parts", [])
+                return parts[0].get("text", "") if parts else msg.get("content", "")
+        return ""
+
     def push_undo(self, state: AgentState, desc: str):
         if state.work_id:
             try:
                 MAX_UNDO = 10
                 if len(state.history) >= MAX_UNDO:
                     oldest = state.history.pop(0)
-                    store.delete(oldest.snapshot_key)
-                df = store.get_df(state.work_id)
-                snapshot_key = store.write_df(df)
+                    # Snapshots are shared keys now; only drop one nothing else points at
+                    live = {state.work_id, state.raw_id} | {e.snapshot_key for e in state.history}
+                    if oldest.snapshot_key not in live:
+                        store.delete(oldest.snapshot_key)
+                # Stored datasets are immutable and every edit writes a new key,
+                # so the current work_id is itself the snapshot -- nothing to copy
                 state.history.append(UndoEntry(
                     description=desc, 
-                    snapshot_key=snapshot_key,
+                    snapshot_key=state.work_id,
                     transformation_report=list(state.transformation_report)
                 ))
             except Exception as e:
@@ -159,13 +288,59 @@ IMPORTANT:
         state.next_node = "human_input"
         return state
 
-    def upload(self, state: AgentState, file_content: bytes, filename: str = "data.csv", description: str = "") -> AgentState:
+    def _read_csv(self, source: Union[bytes, str]) -> pd.DataFrame:
+        """
+        Parse CSV bytes or a CSV file path with the multithreaded Arrow reader,
+        falling back to pandas. Paths are memory-mapped rather than read into memory.
+        """
+        def arrow_input():
+            return pa.BufferReader(source) if isinstance(source, bytes) else pa.memory_map(source)
+
+        def pandas_input():
+            return io.BytesIO(source) if isinstance(source, bytes) else source
+
+        read_options = pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_BYTES)
+        try:
+            # Probe the schema from the first block; keep date-like columns as strings
+            # (matching pandas.read_csv) and leave duplicate headers to pandas' mangling.
+            probe = pa_csv.open_csv(arrow_input(), read_options=read_options)
+            schema = probe.schema
+            probe.close()
+            if len(set(schema.names)) != len(schema.names):
+                raise pa.ArrowInvalid("Duplicate column names")
+
+            column_types = {f.name: pa.string() for f in schema if pa.types.is_temporal(f.type)}
+            table = pa_csv.read_csv(
+                arrow_input(),
+                read_options=read_options,
+                convert_options=pa_csv.ConvertOptions(
+                    null_values=PANDAS_NA_VALUES, strings_can_be_null=True, column_types=column_types
+                )
+            )
+            if any(pa.types.is_binary(t) for t in table.schema.types):
+                raise pa.ArrowInvalid("Non-UTF-8 text")
+            # Arrow reads integers beyond int64 as doubles; pandas keeps them as uint64/object
+            if any(_has_int64_overflow(table.column(i)) for i, t in enumerate(table.schema.types) if pa.types.is_floating(t)):
+                raise pa.ArrowInvalid("Integer column overflows int64")
+            # All-empty columns come back as Arrow nulls; pandas reads them as float NaN
+            null_columns = [f.name for f in table.schema if pa.types.is_null(f.type)]
+            df = table.to_pandas(self_destruct=True, split_blocks=True)
+            if null_columns:
+                df[null_columns] = df[null_columns].astype("float64")
+            return df
+        except pa.ArrowInvalid as e:
+            # Non-UTF-8 input, ragged rows, etc. -- pandas is more forgiving
+            logger.debug(f"Arrow CSV parse failed, falling back to pandas: {e}")
+            try: return pd.read_csv(pandas_input())
+            except UnicodeDecodeError: return pd.read_csv(pandas_input(), encoding='latin1')
+
+    def upload(self, state: AgentState, file_content: Union[bytes, str], filename: str = "data.csv", description: str = "") -> AgentState:
+        """Load an uploaded file, given as raw bytes or a path to a spooled temp file."""
         try:
             if filename.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(io.BytesIO(file_content))
+                df = pd.read_excel(io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content)
             else:
-                try: df = pd.read_csv(io.StringIO(file_content.decode("utf-8")))
-                except UnicodeDecodeError: df = pd.read_csv(io.BytesIO(file_content), encoding='latin1')
+                df = self._read_csv(file_content)
             state.raw_id = store.write_df(df)
             state.work_id = state.raw_id
             state.dataset_description = description
@@ -180,15 +355,13 @@ IMPORTANT:
 
     def run_cycle(self, state: AgentState) -> AgentState:
         """Run the agent cycle until human input is required or safety limit reached."""
-        safety = 0
-        while state.next_node != "human_input" and safety < 10:
-            if state.next_node == "execute":
-                state = self.execute(state)
-            elif state.next_node == "undo":
-                state = self.undo(state)
-            else:
+        # Nodes without a handler (human_input, END, ...) stop the cycle
+        handlers = {"execute": self.execute, "undo": self.undo}
+        for _ in range(MAX_CYCLE_STEPS):
+            handler = handlers.get(state.next_node)
+            if handler is None:
                 break
-            safety += 1
+            state = handler(state)
         return state
 
     @abstractmethod
@@ -19,41 +19,53 @@ CHART_W, CHART_H = 480, 360     # Standard chart dimensions
 MARGIN = 20                     # Gap between charts
 CANVAS_COLS = 2                 # Charts per row in auto-layout
 
+# Column-name patterns, compiled once (applied to every column of every dashboard)
+_ID_NAME_RE = re.compile(r'(^id$|_id$|^idx$|_idx$|^index$|rownum|row_num|uuid|guid)')
+_SEPARATOR_RE = re.compile(r'[_\-]')
+_CAMEL_RE = re.compile(r'([a-z])([A-Z])')
+
+# Column-name fragments that make a text column worth test-parsing as dates
+_DATE_NAME_HINTS = ('date', 'time', 'year', 'month', 'week', 'day', 'dt', 'at', 'created', 'updated', 'timestamp')
+
+# Lower-cased values that make a column boolean-like
+_BOOL_TOKENS = frozenset({'0', '1', 'true', 'false', 'yes', 'no', 'y', 'n', 't', 'f'})
+
 
 # ---------------------------------------------------------------------------
 # Column Profiling Helpers
 # ---------------------------------------------------------------------------
 
-def _is_id_like(col: str, series: pd.Series) -> bool:
-    """Return True if the column looks like an identifier (useless for plotting)."""
+def _is_id_like(col: str, series: pd.Series, n_unique: int) -> bool:
+    """Return True if the column looks like an identifier (useless for plotting). `n_unique` is series.nunique()."""
     col_lower = col.lower()
     # Name patterns
-    if re.search(r'(^id$|_id$|^idx$|_idx$|^index$|rownum|row_num|uuid|guid)', col_lower):
+    if _ID_NAME_RE.search(col_lower):
         return True
     # High-cardinality integers that aren't very meaningful
-    if series.dtype in [np.int64, np.int32, np.int16] and series.nunique() / max(len(series), 1) > 0.95:
+    if series.dtype in [np.int64, np.int32, np.int16] and n_unique / max(len(series), 1) > 0.95:
         return True
     # High-cardinality string (e.g. names, addresses)
-    if series.dtype == object and series.nunique() / max(len(series), 1) > 0.7:
+    if series.dtype == object and n_unique / max(len(series), 1) > 0.7:
         return True
     return False
 
 
 def _is_date_like(col: str, series: pd.Series) -> bool:
     """Return True if the column looks like a date/time field."""
+    # Any datetime resolution (Arrow-backed reads give datetime64[us], not [ns])
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return True
     col_lower = col.lower()
-    if any(kw in col_lower for kw in ['date', 'time', 'year', 'month', 'week', 'day', 'dt', 'at', 'created', 'updated', 'timestamp']):
-        if series.dtype in ['datetime64[ns]', 'datetime64']:
-            return True
-        if series.dtype == object:
+    if any(kw in col_lower for kw in _DATE_NAME_HINTS):
+        # Text columns are object or, under pandas 3, the str dtype
+        if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            # A 50-row sample; failing fast with errors='raise' is cheaper than coercing
             sample = series.dropna().head(50)
             try:
                 pd.to_datetime(sample, errors='raise')
                 return True
             except Exception:
                 pass
-    if series.dtype in ['datetime64[ns]', 'datetime64']:
-        return True
     return False
 
 
@@ -61,10 +73,8 @@ def _is_boolean_like(col: str, series: pd.Series) -> bool:
     """Return True if column has 2 values (binary/boolean)."""
     if series.dtype == bool:
         return True
-    unique_vals = set(str(v).lower() for v in series.dropna().unique())
-    if unique_vals.issubset({'0', '1', 'true', 'false', 'yes', 'no', 'y', 'n', 't', 'f'}):
-        return True
-    return False
+    # Stops at the first non-boolean value instead of stringifying every unique value
+    return all(str(v).lower() in _BOOL_TOKENS for v in series.dropna().unique())
 
 
 def profile_dataframe(df: pd.DataFrame) -> Dict[str, Dict]:
@@ -78,7 +88,9 @@ def profile_dataframe(df: pd.DataFrame) -> Dict[str, Dict]:
         if len(series) == 0:
             continue
 
-        is_id = _is_id_like(col, series)
+        # One hashing pass per column, shared by the id check and the profile
+        n_unique = series.nunique()
+        is_id = _is_id_like(col, series, n_unique)
         is_date = _is_date_like(col, series)
         is_bool = _is_boolean_like(col, series)
 
@@ -93,7 +105,6 @@ def profile_dataframe(df: pd.DataFrame) -> Dict[str, Dict]:
         else:
             col_type = 'categorical'
 
-        n_unique = series.nunique()
         sample_mean = float(series.mean()) if col_type == 'numeric' else None
 
         profiles[col] = {
@@ -115,8 +126,8 @@ def profile_dataframe(df: pd.DataFrame) -> Dict[str, Dict]:
 
 def _prettify(col: str) -> str:
     """Convert column name to a readable label."""
-    s = re.sub(r'[_\-]', ' ', col)
-    s = re.sub(r'([a-z])([A-Z])', r'\1 \2', s)  # camelCase
+    s = _SEPARATOR_RE.sub(' ', col)
+    s = _CAMEL_RE.sub(r'\1 \2', s)  # camelCase
     return s.title()
 
 
@@ -1,9 +1,17 @@
 import io
 import sys
+import ast
+import re
+import math
+import statistics
+import itertools
+import marshal
+import pickle
 import multiprocessing
 import traceback
 from contextlib import redirect_stdout
-from typing import Tuple, Optional, Any, Dict
+from functools import lru_cache
+from typing import Tuple, Optional, Any, Dict, List
 import pandas as pd
 import numpy as np
 import sklearn
@@ -44,9 +52,129 @@ SAFE_BUILTINS = {
     "int": int,
     "float": float,
     "bool": bool,
-    "__import__": __import__,
 }
 
+# Modules preloaded into every script's globals; user code may not import anything
+PRELOADED_MODULES = {
+    "pd": pd,
+    "np": np,
+    "sklearn": sklearn,
+    "preprocessing": preprocessing,
+    "linear_model": linear_model,
+    "cluster": cluster,
+    "metrics": metrics,
+    "decomposition": decomposition,
+    "ensemble": ensemble,
+    "manifold": manifold,
+    "scipy": scipy,
+    "statsmodels": sm,
+    "sm": sm,
+    "datetime": datetime,
+    "math": math,
+    "statistics": statistics,
+    "re": re,
+    "itertools": itertools,
+}
+
+FORBIDDEN_CALLS = {
+    "eval": "eval() not allowed",
+    "exec": "exec() not allowed",
+    "compile": "compile() not allowed",
+    "open": "File operations not allowed",
+    "file": "File operations not allowed",
+    "input": "User input not allowed",
+    "raw_input": "User input not allowed",
+    "__import__": "Dynamic imports not allowed",
+    "getattr": "Attribute access functions not allowed",
+    "setattr": "Attribute access functions not allowed",
+    "delattr": "Attribute access functions not allowed",
+    "hasattr": "Attribute access functions not allowed",
+    "globals": "Global state access not allowed",
+    "locals": "Local state access not allowed",
+    "vars": "Variables access not allowed",
+    "dir": "Directory inspection not allowed",
+    "breakpoint": "Debugger access not allowed",
+}
+
+FORBIDDEN_NAMES = {
+    "os": "OS module access not allowed",
+    "sys": "System module access not allowed",
+    "subprocess": "Subprocess module not allowed",
+    "socket": "Network access not allowed",
+    "requests": "External requests not allowed",
+    "urllib": "External requests not allowed",
+    "__builtins__": "Access to builtins not allowed",
+}
+
+
+class _CodeValidator(ast.NodeVisitor):
+    """Single pass over the AST; raises ValueError with a user-facing message on the first violation."""
+
+    def _reject_import(self, module: Optional[str]):
+        root = (module or "").split(".")[0]
+        if root in FORBIDDEN_NAMES:
+            raise ValueError(FORBIDDEN_NAMES[root])
+        raise ValueError(
+            f"Import statements not allowed; available modules are preloaded: {', '.join(PRELOADED_MODULES)}"
+        )
+
+    def visit_Import(self, node: ast.Import):
+        self._reject_import(node.names[0].name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        self._reject_import(node.module)
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Name) and node.func.id in FORBIDDEN_CALLS:
+            raise ValueError(FORBIDDEN_CALLS[node.func.id])
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in FORBIDDEN_CALLS:
+            raise ValueError(FORBIDDEN_CALLS[node.id])
+        if node.id in FORBIDDEN_NAMES:
+            raise ValueError(FORBIDDEN_NAMES[node.id])
+        if node.id.startswith("__"):
+            raise ValueError("Double underscore attributes not allowed")
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if node.attr.startswith("__"):
+            raise ValueError("Double underscore attributes not allowed")
+        # Private names, e.g. module aliases such as re._compiler or pd._libs
+        if node.attr.startswith("_"):
+            raise ValueError("Private attributes not allowed")
+        # Modules re-exported by allowed packages (e.g. pd.io.common.os)
+        if node.attr in FORBIDDEN_NAMES:
+            raise ValueError(FORBIDDEN_NAMES[node.attr])
+        self.generic_visit(node)
+
+    def visit_Constant(self, node: ast.Constant):
+        # Strings reach evaluators such as df.query()/pd.eval()
+        if isinstance(node.value, str) and "__" in node.value:
+            raise ValueError("Double underscore attributes not allowed")
+
+
+@lru_cache(maxsize=256)
+def _check_code(code: str) -> Tuple[bool, str, Optional[bytes]]:
+    """
+    Parse, validate and compile a script from a single parse; cached per distinct
+    script, so retries and re-runs of the same code skip all three. The code object
+    is marshalled so it can be handed to the worker process under any
+    multiprocessing start method (code objects do not pickle).
+    """
+    try:
+        tree = ast.parse(code, mode="exec")
+    except SyntaxError as e:
+        return False, f"SyntaxError: {e.msg} (line {e.lineno})", None
+    
+    # Reject imports; check calls and names against the deny lists
+    try:
+        _CodeValidator().visit(tree)
+    except ValueError as e:
+        return False, str(e), None
+    
+    return True, "", marshal.dumps(compile(tree, "<user>", "exec"))
+
 def validate_code(code: str) -> Tuple[bool, str]:
     """
     Validate Python code before execution.
@@ -56,74 +184,83 @@ def validate_code(code: str) -> Tuple[bool, str]:
     if len(code) > settings.max_code_length:
         return False, f"Code too long (max {settings.max_code_length} characters)"
     
-    # Check for dangerous patterns
-    dangerous_patterns = [
-        ('os.', 'OS module access not allowed'),
-        ('sys.', 'System module access not allowed'),
-        ('subprocess', 'Subprocess module not allowed'),
-        ('socket', 'Network access not allowed'),
-        ('__import__', 'Dynamic imports not allowed'),
-        ('eval(', 'eval() not allowed'),
-        ('exec(', 'exec() not allowed'),
-        ('compile(', 'compile() not allowed'),
-        ('open(', 'File operations not allowed'),
-        ('file(', 'File operations not allowed'),
-        ('input(', 'User input not allowed'),
-        ('raw_input(', 'User input not allowed'),
-        ('requests', 'External requests not allowed'),
-        ('urllib', 'External requests not allowed'),
-        ('getattr', 'Attribute access functions not allowed'),
-        ('setattr', 'Attribute access functions not allowed'),
-        ('delattr', 'Attribute access functions not allowed'),
-        ('hasattr', 'Attribute access functions not allowed'),
-        ('globals(', 'Global state access not allowed'),
-        ('locals(', 'Local state access not allowed'),
-        ('vars(', 'Variables access not allowed'),
-        ('dir(', 'Directory inspection not allowed'),
-        ('__builtins__', 'Access to builtins not allowed'),
-        ('_' + '_', 'Double underscore attributes not allowed'),
-    ]
-    
-    code_lower = code.lower()
-    for pattern, message in dangerous_patterns:
-        if pattern in code_lower:
-            return False, message
-    
-    return True, ""
+    is_valid, error_msg, _ = _check_code(code)
+    return is_valid, error_msg
 
-def _execute_script(code: str, df: pd.DataFrame, return_dict: Dict):
+def _compile_user_code(code: str) -> bytes:
+    """Compiled form of code that passed validate_code()."""
+    return _check_code(code)[2]
+
+def _dump_df(df: pd.DataFrame) -> List[memoryview]:
+    """
+    Pickle a dataframe (protocol 5) into its payload followed by its out-of-band array
+    buffers, which reference the blocks' memory instead of copying it.
+    """
+    buffers = []
+    payload = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+    return [memoryview(payload)] + [buf.raw() for buf in buffers]
+
+def _recv_df(conn, sizes: List[int]) -> pd.DataFrame:
+    """Receive the chunks of _dump_df and unpickle them; bytearrays keep the rebuilt arrays writable."""
+    chunks = [bytearray(size) for size in sizes]
+    for chunk in chunks:
+        conn.recv_bytes_into(chunk)
+    return pickle.loads(chunks[0], buffers=chunks[1:])
+
+def _execute_script(code: bytes, df: pd.DataFrame, conn):
     """
-    Worker function to execute script in a separate process.
+    Worker function to execute a compiled script (see _compile_user_code) in a separate process.
+    Sends a result dict (success, error, stdout, df_sizes) back through `conn`, followed
+    on success by the resulting dataframe's chunks (see _dump_df).
     """
-    output = io.StringIO()
+    return_dict: Dict[str, Any] = {"success": False}
+    chunks = []
+    try:
+        _run_script(code, df, return_dict)
+        if return_dict["success"]:
+            chunks = _dump_df(return_dict.pop("df"))
+            return_dict["df_sizes"] = [chunk.nbytes for chunk in chunks]
+    except Exception as e:
+        chunks = []
+        return_dict = {"success": False, "error": f"{type(e).__name__}: {e}", "stdout": return_dict.get("stdout", "")}
+    conn.send(return_dict)
+    for chunk in chunks:
+        conn.send_bytes(chunk)
+    conn.close()
+
+class _OutputLimitExceeded(Exception):
+    pass
+
+class _BoundedStringIO(io.StringIO):
+    """stdout capture that stops a script once it has printed `limit` characters."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self._remaining = limit
+
+    def write(self, s: str) -> int:
+        if len(s) > self._remaining:
+            super().write(s[:self._remaining])
+            self._remaining = 0
+            raise _OutputLimitExceeded(f"Output limit reached (max {settings.max_stdout_chars} characters)")
+        self._remaining -= len(s)
+        return super().write(s)
+
+def _run_script(code: bytes, df: pd.DataFrame, return_dict: Dict):
+    output = _BoundedStringIO(settings.max_stdout_chars)
     
     try:
         # Create safe execution environment
-        safe_globals = {
-            "__builtins__": SAFE_BUILTINS,
-            "pd": pd,
-            "np": np,
-            "sklearn": sklearn,
-            "preprocessing": preprocessing,
-            "linear_model": linear_model,
-            "cluster": cluster,
-            "metrics": metrics,
-            "decomposition": decomposition,
-            "ensemble": ensemble,
-            "manifold": manifold,
-            "scipy": scipy,
-            "statsmodels": sm,
-            "sm": sm,
-            "datetime": datetime,
-        }
+        safe_globals = {"__builtins__": SAFE_BUILTINS, **PRELOADED_MODULES}
         
+        # Shallow copy: under Copy-on-Write, blocks are only copied if the script modifies them
         safe_locals = {
-            "df": df.copy(),
+            "df": df.copy(deep=False),
         }
         
         # Execute code capturing stdout
         with redirect_stdout(output):
-            exec(code, safe_globals, safe_locals)
+            exec(marshal.loads(code), safe_globals, safe_locals)
             
         # Verify df still exists and is valid
         if "df" not in safe_locals:
@@ -142,6 +279,9 @@ def _execute_script(code: str, df: pd.DataFrame, return_dict: Dict):
         return_dict["stdout"] = output.getvalue()
         return_dict["success"] = True
         
+    except _OutputLimitExceeded as e:
+        return_dict["error"] = str(e)
+        return_dict["stdout"] = output.getvalue()
     except Exception:
         # Capture full traceback
         exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -162,34 +302,66 @@ def exec_code(code: str, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[str],
         logger.warning(f"Code validation failed: {error_msg}")
         return df, error_msg, ""
     
-    # Use multiprocessing Manager to share results
-    manager = multiprocessing.Manager()
-    return_dict = manager.dict()
-    return_dict["success"] = False
-    
-    # Create process
-    p = multiprocessing.Process(target=_execute_script, args=(code, df, return_dict))
+    # One-way pipe for the result. A forked child inherits the input frame; other
+    # start methods (Windows/macOS) receive it pickled with the process arguments.
+    recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+    p = multiprocessing.Process(
+        target=_execute_script,
+        args=(_compile_user_code(code), df, send_conn),
+        daemon=True
+    )
     
     try:
         p.start()
-        p.join(timeout=settings.code_exec_timeout_seconds)
+        send_conn.close()
         
-        if p.is_alive():
+        # Receive before joining: a large result would otherwise block the child on a full pipe
+        if not recv_conn.poll(settings.code_exec_timeout_seconds):
             logger.error("Code execution timed out - killing process")
             p.terminate()
             p.join()
             return df, f"Execution timed out after {settings.code_exec_timeout_seconds} seconds", ""
+        
+        try:
+            return_dict = recv_conn.recv()
+            result_df = _recv_df(recv_conn, return_dict["df_sizes"]) if return_dict.get("success") else None
+        except EOFError:
+            p.join()
+            return_dict = {"error": f"Execution process exited unexpectedly (exit code {p.exitcode})"}
+        p.join()
             
         if not return_dict.get("success"):
             error = return_dict.get("error", "Unknown execution error")
             stdout = return_dict.get("stdout", "")
             return df, error, stdout
             
-        return return_dict["df"], None, return_dict["stdout"]
+        return result_df, None, return_dict["stdout"]
         
     except Exception as e:
         logger.error(f"Execution wrapper error: {e}")
+        if p.is_alive():
+            p.terminate()
         return df, str(e), ""
+    finally:
+        recv_conn.close()
+
+def _numeric_diff_mask(df_old: pd.DataFrame, df_new: pd.DataFrame) -> Optional[np.ndarray]:
+    """
+    Changed-cell mask for frames sharing a single numeric numpy dtype, computed on
+    one contiguous block with the NaN-on-both-sides check fused in place.
+    Returns None for anything else (mixed, object or extension dtypes).
+    """
+    dtypes = set(df_old.dtypes) | set(df_new.dtypes)
+    if len(dtypes) != 1:
+        return None
+    dtype = dtypes.pop()
+    if not isinstance(dtype, np.dtype) or dtype.kind not in "iufb":
+        return None
+    a, b = df_old.to_numpy(), df_new.to_numpy()
+    ne = a != b
+    if dtype.kind == "f":
+        ne &= ~(np.isnan(a) & np.isnan(b))
+    return ne
 
 def compare_dataframes(df_old: pd.DataFrame, df_new: pd.DataFrame) -> str:
     """
@@ -197,6 +369,11 @@ def compare_dataframes(df_old: pd.DataFrame, df_new: pd.DataFrame) -> str:
     """
     if df_old is None:
         return "New dataframe created."
+
+    # Nothing changed (no-op script or operation): equals() stops at the first difference
+    # and needs no cell mask, so this also covers frames too large for the detailed diff
+    if df_old is df_new or df_old.equals(df_new):
+        return "No changes detected."
         
     changes = []
     
@@ -217,18 +394,21 @@ def compare_dataframes(df_old: pd.DataFrame, df_new: pd.DataFrame) -> str:
                  changes.append("*(Data too large for detailed cell-by-cell comparison)*")
             else:
                 try:
-                    ne = (df_old != df_new) & ~(df_old.isna() & df_new.isna())
-                    changed_counts = ne.sum().sum()
+                    ne = _numeric_diff_mask(df_old, df_new)
+                    if ne is None:
+                        # Compare positionally: a reordered index (e.g. after sort_values)
+                        # must not make pandas refuse the comparison
+                        df_cmp = df_new.set_axis(df_old.index, axis=0)
+                        # Let pandas compare per dtype, then reduce on plain boolean ndarrays
+                        ne = (df_old != df_cmp).to_numpy() & ~(df_old.isna().to_numpy() & df_cmp.isna().to_numpy())
+                    changed_counts = int(np.count_nonzero(ne))
                     
                     if changed_counts > 0:
                         changes.append(f"**Values Changed:** {changed_counts} cells modified.")
                         
                         # Show a few examples
-                        diff_indices = np.where(ne)
                         examples = []
-                        for i in range(min(5, len(diff_indices[0]))):
-                            row_idx = diff_indices[0][i]
-                            col_idx = diff_indices[1][i]
+                        for row_idx, col_idx in np.argwhere(ne)[:5]:
                             col_name = df_old.columns[col_idx]
                             val_old = df_old.iloc[row_idx, col_idx]
                             val_new = df_new.iloc[row_idx, col_idx]
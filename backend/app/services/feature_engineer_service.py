@@ -17,7 +17,7 @@ class FeatureEngineeringService:
         """
         Automatically scales numeric columns based on their distribution.
         """
-        df_scaled = df.copy()
+        df_scaled = df.copy(deep=False)
         numeric_cols = df_scaled.select_dtypes(include=[np.number]).columns
         report = []
 
@@ -53,7 +53,7 @@ class FeatureEngineeringService:
         """
         Automatically identifies date strings and extracts features.
         """
-        df_ext = df.copy()
+        df_ext = df.copy(deep=False)
         report = []
         for col in df_ext.columns:
             if df_ext[col].dtype == 'object':
@@ -77,7 +77,7 @@ class FeatureEngineeringService:
         """
         Automatically encodes categorical variables.
         """
-        df_enc = df.copy()
+        df_enc = df.copy(deep=False)
         cat_cols = df_enc.select_dtypes(include=['object', 'category']).columns
         report = []
 
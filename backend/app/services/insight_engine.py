@@ -79,7 +79,8 @@ class InsightEngine:
             return insights
 
         try:
-            df_sorted = df.sort_values(by=time_column).copy()
+            # Sort only the two columns involved; the sorted frame is already a new object
+            df_sorted = df[[time_column, value_column]].sort_values(by=time_column)
             df_sorted['rolling_mean'] = df_sorted[value_column].rolling(window=window).mean()
             
             if len(df_sorted) > window:
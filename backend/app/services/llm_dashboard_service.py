@@ -4,16 +4,26 @@ using the LLM. The LLM receives a structured data profile and returns a full HTM
 with interactive Plotly charts, KPI cards, and a professional dark theme.
 """
 
-import json
 import re
 import pandas as pd
 import numpy as np
+from hashlib import sha256
 from typing import Optional
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.cache import llm_cache
+from app.core.serialization import df_to_records, dumps
 
 logger = get_logger()
 
+# Generated dashboards are cached by prompt, i.e. by the exact data profile the LLM sees
+DASHBOARD_CACHE_TTL = 86400
+
+# Markdown fences around the returned HTML, and the HTML document inside a chatty reply
+_HTML_FENCE_OPEN_RE = re.compile(r'^```html?\s*', re.IGNORECASE)
+_HTML_FENCE_CLOSE_RE = re.compile(r'\s*```$')
+_HTML_DOC_RE = re.compile(r'(<!DOCTYPE html.*?</html>)', re.IGNORECASE | re.DOTALL)
+
 
 # ---------------------------------------------------------------------------
 # Data Profiler
@@ -80,10 +90,8 @@ def _build_data_profile(df: pd.DataFrame) -> dict:
 
     # Include a 5-row sample as context
     try:
-        sample_df = df.head(5).replace({np.nan: None, np.inf: None, -np.inf: None})
-        profile["sample_data"] = sample_df.astype(object).where(
-            sample_df.notna(), None
-        ).to_dict(orient="records")
+        # Missing values need no replacing: the profile is serialized with dumps(), which writes them as null
+        profile["sample_data"] = df_to_records(df.head(5))
     except Exception:
         profile["sample_data"] = []
 
@@ -116,7 +124,7 @@ STRICT RULES:
 
 
 def _build_prompt(profile: dict) -> str:
-    profile_json = json.dumps(profile, indent=2, default=str)
+    profile_json = dumps(profile, indent=True).decode()
     return f"""{_SYSTEM_PROMPT}
 
 DATA PROFILE:
@@ -186,16 +194,24 @@ class LLMDashboardService:
             logger.error(f"LLM init failed: {e}")
             return None
 
-    def generate(self, df: pd.DataFrame) -> str:
+    def generate(self, df: pd.DataFrame, use_cache: bool = True) -> str:
         """
         Profile `df`, ask the LLM to generate a Plotly HTML dashboard, and return
         the HTML string. Falls back to a safe error page on failure.
+        A dashboard already generated for the same profile is reused unless `use_cache` is False.
         """
         try:
             logger.info(f"LLM Plotly dashboard: {len(df)} rows × {len(df.columns)} cols")
             profile = _build_data_profile(df)
             prompt = _build_prompt(profile)
 
+            cache_key = f"plotly_dashboard_{sha256(prompt.encode()).hexdigest()}"
+            if use_cache and settings.enable_cache:
+                cached = llm_cache.get(cache_key)
+                if cached:
+                    logger.info("Plotly dashboard served from cache")
+                    return cached
+
             llm = self._get_llm()
             if llm is None:
                 logger.error("LLM unavailable for Plotly dashboard generation")
@@ -206,14 +222,16 @@ class LLMDashboardService:
             raw = response.content.strip()
 
             # Strip markdown code fences if the LLM wrapped the HTML
-            raw = re.sub(r'^```html?\s*', '', raw, flags=re.IGNORECASE)
-            raw = re.sub(r'\s*```$', '', raw, flags=re.IGNORECASE)
+            if raw.startswith('```'):
+                raw = _HTML_FENCE_OPEN_RE.sub('', raw)
+            if raw.endswith('```'):
+                raw = _HTML_FENCE_CLOSE_RE.sub('', raw)
             raw = raw.strip()
 
             # Minimal sanity check — must look like HTML
             if not raw.lower().startswith('<!doctype') and '<html' not in raw.lower():
                 # Try to find HTML block inside the response
-                match = re.search(r'(<!DOCTYPE html.*?</html>)', raw, re.IGNORECASE | re.DOTALL)
+                match = _HTML_DOC_RE.search(raw)
                 if match:
                     raw = match.group(1).strip()
                 else:
@@ -221,6 +239,8 @@ class LLMDashboardService:
                     return _FALLBACK_HTML
 
             logger.info("Plotly dashboard HTML generated successfully")
+            if settings.enable_cache:
+                llm_cache.set(cache_key, raw, ttl=DASHBOARD_CACHE_TTL)
             return raw
 
         except Exception as e:
@@ -16,22 +16,26 @@ class ProcessingService:
         Strategies: 'mean', 'median', 'mode', 'drop', 'constant'
         """
         try:
-            df_new = df.copy()
-            for col in columns:
-                if col not in df_new.columns:
-                    continue
-                
-                if strategy == 'drop':
-                    df_new.dropna(subset=[col], inplace=True)
-                elif strategy == 'mean' and pd.api.types.is_numeric_dtype(df_new[col]):
-                    df_new[col] = df_new[col].fillna(df_new[col].mean())
-                elif strategy == 'median' and pd.api.types.is_numeric_dtype(df_new[col]):
-                    df_new[col] = df_new[col].fillna(df_new[col].median())
-                elif strategy == 'mode':
-                    if not df_new[col].mode().empty:
-                        df_new[col] = df_new[col].fillna(df_new[col].mode()[0])
-                elif strategy == 'constant':
-                     df_new[col] = df_new[col].fillna(fill_value if fill_value is not None else "Unknown")
+            df_new = df.copy(deep=False)
+            cols = [col for col in dict.fromkeys(columns) if col in df_new.columns]
+            if not cols:
+                return df_new
+
+            # One vectorized call per strategy over all selected columns
+            if strategy == 'drop':
+                df_new = df_new.dropna(subset=cols)
+            elif strategy in ('mean', 'median'):
+                num_cols = [col for col in cols if pd.api.types.is_numeric_dtype(df_new[col])]
+                if num_cols:
+                    fill = df_new[num_cols].mean() if strategy == 'mean' else df_new[num_cols].median()
+                    df_new[num_cols] = df_new[num_cols].fillna(fill)
+            elif strategy == 'mode':
+                modes = df_new[cols].mode()
+                if not modes.empty:
+                    # First mode per column; NaN (no fill) for all-missing columns
+                    df_new[cols] = df_new[cols].fillna(modes.iloc[0])
+            elif strategy == 'constant':
+                df_new[cols] = df_new[cols].fillna(fill_value if fill_value is not None else "Unknown")
             
             return df_new
         except Exception as e:
@@ -50,12 +54,16 @@ class ProcessingService:
             return df
 
         if method == 'iqr':
-            Q1 = df[column].quantile(0.25)
-            Q3 = df[column].quantile(0.75)
+            values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+            present = values[~np.isnan(values)]
+            if present.size == 0:
+                return df.iloc[:0]
+            # Both quartiles from one introselect over the non-missing values
+            Q1, Q3 = np.quantile(present, [0.25, 0.75])
             IQR = Q3 - Q1
             lower_bound = Q1 - (threshold * IQR)
             upper_bound = Q3 + (threshold * IQR)
-            return df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
+            return df[(values >= lower_bound) & (values <= upper_bound)]
             
         elif method == 'zscore':
             mean = df[column].mean()
@@ -71,7 +79,7 @@ class ProcessingService:
         Scale numerical columns.
         Methods: 'minmax', 'standard'
         """
-        df_new = df.copy()
+        df_new = df.copy(deep=False)
         for col in columns:
             if col not in df_new.columns or not pd.api.types.is_numeric_dtype(df_new[col]):
                 continue
@@ -94,7 +102,7 @@ class ProcessingService:
         Encode categorical columns.
         Methods: 'onehot', 'label'
         """
-        df_new = df.copy()
+        df_new = df.copy(deep=False)
         if method == 'onehot':
             return pd.get_dummies(df_new, columns=columns, prefix=columns)
         elif method == 'label':
@@ -123,7 +131,7 @@ class ProcessingService:
         if column not in df.columns:
             return df
         
-        df_new = df.copy()
+        df_new = df.copy(deep=False)
         try:
             if target_type == 'int':
                 df_new[column] = pd.to_numeric(df_new[column], errors='coerce').fillna(0).astype(int)
@@ -145,7 +153,7 @@ class ProcessingService:
         Create a new column using a numeric expression.
         Assumes expression uses column names directly.
         """
-        df_new = df.copy()
+        df_new = df.copy(deep=False)
         try:
             # Simple eval for basic arithmetic
             # We use eval in a controlled way if possible, or simple replacement
@@ -1,76 +1,410 @@
 import os
 import json
 import time
-from typing import Dict, List, Optional
+import pickle
+import sqlite3
+import asyncio
+import threading
+from contextlib import suppress
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from app.models.agent_state import AgentState
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.serialization import dumps, loads
 
 logger = get_logger()
 
-class SessionService:
-    def __init__(self):
-        self.sessions_dir = os.path.join(settings.data_store_path, "sessions")
+# Index journal records appended before they are folded back into the index snapshot
+JOURNAL_COMPACT_LINES = 1000
+
+
+def _atomic_write(path: str, data: bytes):
+    """Write via a temp file and rename, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _index_entry(session_id: str, data: Dict, timestamp: float) -> Dict:
+    return {
+        "id": session_id,
+        "work_id": data.get('work_id', '') or '',
+        "title": (data.get('user_message', '') or "New Session")[:50],
+        "timestamp": timestamp
+    }
+
+
+class DiskSessionBackend:
+    """
+    Sessions as pickle files plus a JSON index, local to this node. The index is a
+    snapshot (index.json) and an append-only journal (index.jsonl) of later changes,
+    so a save appends one line instead of rewriting the whole index.
+    """
+
+    shared = False
+
+    def __init__(self, base_path: str):
+        self.sessions_dir = os.path.join(base_path, "sessions")
         os.makedirs(self.sessions_dir, exist_ok=True)
         self.index_path = os.path.join(self.sessions_dir, "index.json")
+        self.journal_path = os.path.join(self.sessions_dir, "index.jsonl")
+        self._index_lock = threading.RLock()
+        self._journal_lines = 0
         self._ensure_index()
 
     def _get_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.pkl")
+
+    def _get_legacy_path(self, session_id: str) -> str:
+        """Sessions saved before the pickle switch are JSON files."""
         return os.path.join(self.sessions_dir, f"{session_id}.json")
 
+    def _read_state_data(self, path: str) -> Dict:
+        """Read a raw session dict from either a pickle or a legacy JSON file."""
+        if path.endswith(".pkl"):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        with open(path, 'r') as f:
+            return json.load(f)
+
     def _ensure_index(self):
-        """Ensure index file exists."""
+        """Ensure index file exists, folding in the journal left by the previous run."""
         if not os.path.exists(self.index_path):
             self._rebuild_index()
+        else:
+            self._compact()
 
     def _load_index(self) -> Dict[str, Dict]:
+        """The index snapshot with the journal replayed over it."""
+        index = {}
         try:
-            if not os.path.exists(self.index_path):
-                return {}
-            with open(self.index_path, 'r') as f:
-                return json.load(f)
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'rb') as f:
+                    index = loads(f.read())
         except Exception as e:
             logger.error(f"Failed to load session index: {e}")
-            return {}
-
-    def _save_index(self, index: Dict[str, Dict]):
         try:
-            with open(self.index_path, 'w') as f:
-                json.dump(index, f, indent=2)
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = loads(line)
+                        except ValueError:
+                            continue  # torn line from an interrupted append
+                        if record.get("deleted"):
+                            index.pop(record["id"], None)
+                        else:
+                            index[record["id"]] = record
         except Exception as e:
-            logger.error(f"Failed to save session index: {e}")
+            logger.error(f"Failed to load session index journal: {e}")
+        return index
+
+    def _save_index(self, index: Dict[str, Dict]):
+        """Write a full index snapshot and empty the journal."""
+        with self._index_lock:
+            try:
+                _atomic_write(self.index_path, dumps(index))
+                open(self.journal_path, 'wb').close()
+                self._journal_lines = 0
+            except Exception as e:
+                logger.error(f"Failed to save session index: {e}")
+
+    def _compact(self):
+        with self._index_lock:
+            self._save_index(self._load_index())
+
+    def _append_index(self, record: Dict):
+        """Journal one index change: an entry, or {"id": ..., "deleted": True}."""
+        with self._index_lock:
+            with open(self.journal_path, 'ab') as f:
+                f.write(dumps(record) + b"\n")
+            self._journal_lines += 1
+            if self._journal_lines >= JOURNAL_COMPACT_LINES:
+                self._compact()
 
     def _rebuild_index(self):
         """Rebuild index from existing files."""
         logger.info("Rebuilding session index...")
         index = {}
         if os.path.exists(self.sessions_dir):
-            for filename in os.listdir(self.sessions_dir):
-                if filename.endswith(".json") and filename != "index.json":
-                    sid = filename[:-5]
+            # One directory scan: DirEntry carries the name and a cached stat()
+            with os.scandir(self.sessions_dir) as it:
+                entries = {e.name: e for e in it}
+            for filename, entry in entries.items():
+                sid, ext = os.path.splitext(filename)
+                if ext == ".pkl" or (ext == ".json" and filename != "index.json"):
+                    # A pickle supersedes a legacy JSON file for the same session
+                    if ext == ".json" and f"{sid}.pkl" in entries:
+                        continue
                     try:
-                        path = self._get_path(sid)
-                        with open(path, 'r') as f:
-                            data = json.load(f)
-                        
-                        index[sid] = {
-                            "id": sid,
-                            "work_id": data.get('work_id', ''),
-                            "title": (data.get('user_message', '') or "New Session")[:50],
-                            "timestamp": os.path.getmtime(path)
-                        }
+                        data = self._read_state_data(entry.path)
+                        index[sid] = _index_entry(sid, data, entry.stat().st_mtime)
                     except Exception as e:
                         logger.warning(f"Skipping corrupt session {sid}: {e}")
         self._save_index(index)
 
+    def save(self, session_id: str, data: Dict):
+        _atomic_write(self._get_path(session_id), pickle.dumps(data, protocol=5))
+        try:
+            self._append_index(_index_entry(session_id, data, time.time()))
+        except Exception as e:
+            logger.error(f"Failed to update index for {session_id}: {e}")
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        path = self._get_path(session_id)
+        if not os.path.exists(path):
+            path = self._get_legacy_path(session_id)
+            if not os.path.exists(path):
+                return None
+        return self._read_state_data(path)
+
+    def delete(self, session_id: str):
+        for path in (self._get_path(session_id), self._get_legacy_path(session_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+        # Remove from index
+        try:
+            self._append_index({"id": session_id, "deleted": True})
+        except Exception as e:
+            logger.error(f"Failed to update index after delete {session_id}: {e}")
+
+    def rename(self, session_id: str, title: str) -> bool:
+        entry = self._load_index().get(session_id)
+        if entry is None:
+            return False
+        entry["title"] = title[:50]
+        self._append_index(entry)
+        return True
+
+    def list_index(self) -> List[Dict]:
+        # Check if index exists, if not rebuild
+        if not os.path.exists(self.index_path):
+            self._rebuild_index()
+        return list(self._load_index().values())
+
+
+class SqliteSessionBackend:
+    """
+    Sessions as pickled rows in one SQLite file (WAL mode), local to this node.
+    Index fields live in their own columns, so listing never unpickles a state.
+    """
+
+    shared = False
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, work_id TEXT NOT NULL, "
+            "title TEXT NOT NULL, timestamp REAL NOT NULL, state BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    def _put(self, entry: Dict, data: Dict):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (id, work_id, title, timestamp, state) VALUES (?, ?, ?, ?, ?)",
+            (entry["id"], entry["work_id"], entry["title"], entry["timestamp"], pickle.dumps(data, protocol=5))
+        )
+
+    def save(self, session_id: str, data: Dict):
+        with self._lock:
+            self._put(_index_entry(session_id, data, time.time()), data)
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def rename(self, session_id: str, title: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "UPDATE sessions SET title = ? WHERE id = ?", (title[:50], session_id)
+            ).rowcount > 0
+
+    def list_index(self) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, work_id, title, timestamp FROM sessions").fetchall()
+        return [{"id": sid, "work_id": work_id, "title": title, "timestamp": ts} for sid, work_id, title, ts in rows]
+
+    def import_legacy(self, legacy: "DiskSessionBackend") -> int:
+        """
+        One-time copy of sessions from the pickle/JSON file store, keeping their titles
+        and timestamps. Runs in one transaction and is recorded, so it never repeats.
+        """
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM meta WHERE key = 'legacy_import'").fetchone():
+                return 0
+            count = 0
+            self._db.execute("BEGIN")
+            try:
+                for entry in legacy.list_index():
+                    try:
+                        data = legacy.load(entry["id"])
+                    except Exception as e:
+                        logger.warning(f"Skipping corrupt session {entry['id']}: {e}")
+                        continue
+                    if data is not None:
+                        self._put(entry, data)
+                        count += 1
+                self._db.execute("INSERT INTO meta (key, value) VALUES ('legacy_import', ?)", (str(time.time()),))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return count
+
+
+class RedisSessionBackend:
+    """
+    Sessions as pickled blobs in Redis with SETEX expiry, so several
+    uvicorn workers (or hosts) share one session store.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "flowmatics:session:"):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._client.ping()
+        self._ttl = ttl_seconds
+        self._prefix = prefix
+        self._index_key = f"{prefix}index"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self._prefix}{session_id}"
+
+    def save(self, session_id: str, data: Dict):
+        entry = _index_entry(session_id, data, time.time())
+        pipe = self._client.pipeline()
+        pipe.setex(self._key(session_id), self._ttl, pickle.dumps(data, protocol=5))
+        pipe.hset(self._index_key, session_id, dumps(entry))
+        pipe.execute()
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        blob = self._client.get(self._key(session_id))
+        return pickle.loads(blob) if blob is not None else None
+
+    def delete(self, session_id: str):
+        pipe = self._client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.hdel(self._index_key, session_id)
+        pipe.execute()
+
+    def rename(self, session_id: str, title: str) -> bool:
+        raw = self._client.hget(self._index_key, session_id)
+        if raw is None:
+            return False
+        entry = loads(raw)
+        entry["title"] = title[:50]
+        self._client.hset(self._index_key, session_id, dumps(entry))
+        return True
+
+    def list_index(self) -> List[Dict]:
+        raw = self._client.hgetall(self._index_key)
+        if not raw:
+            return []
+        sids = [sid.decode() for sid in raw]
+        pipe = self._client.pipeline()
+        for sid in sids:
+            pipe.exists(self._key(sid))
+        alive = pipe.execute()
+
+        # Blobs expire on their own; drop their index entries lazily
+        expired = [sid for sid, ok in zip(sids, alive) if not ok]
+        if expired:
+            self._client.hdel(self._index_key, *expired)
+        return [loads(raw[sid.encode()]) for sid, ok in zip(sids, alive) if ok]
+
+
+def get_session_backend():
+    """
+    Pick Redis when SESSION_REDIS_URL is configured and reachable, else the local
+    store named by SESSION_BACKEND (SQLite by default, or the pickle file store).
+    """
+    if settings.session_redis_url:
+        try:
+            backend = RedisSessionBackend(
+                settings.session_redis_url,
+                ttl_seconds=settings.session_ttl_hours * 3600
+            )
+            logger.info("Using Redis session backend")
+            return backend
+        except Exception as e:
+            logger.warning(f"Redis session backend unavailable ({e}), falling back to local storage")
+    if settings.session_backend == "disk":
+        return DiskSessionBackend(settings.data_store_path)
+
+    backend = SqliteSessionBackend(os.path.join(settings.data_store_path, "sessions.sqlite"))
+    # Carry over sessions saved by the file store before the SQLite switch
+    if os.path.isdir(os.path.join(settings.data_store_path, "sessions")):
+        try:
+            imported = backend.import_legacy(DiskSessionBackend(settings.data_store_path))
+            if imported:
+                logger.info(f"Imported {imported} sessions into SQLite")
+        except Exception as e:
+            logger.error(f"Failed to import legacy sessions: {e}")
+    return backend
+
+
+class SessionService:
+    def __init__(self, backend=None):
+        self.backend = backend or get_session_backend()
+
+        # Bounded LRU + TTL cache of loaded sessions: session_id -> (expires_at, state).
+        # A shared backend can be written by other workers, so nothing is kept locally.
+        self._cache: "OrderedDict[str, Tuple[float, AgentState]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = 0 if self.backend.shared else settings.session_cache_size
+        self._cache_ttl = settings.session_ttl_hours * 3600
+
+        # Debounced writes: dirty sessions wait here until the flusher persists them
+        self._pending: Dict[str, AgentState] = {}
+        self._flush_lock = threading.Lock()
+        self._flush_interval = settings.session_flush_interval_seconds
+        self._flusher_task: Optional[asyncio.Task] = None
+
+    def _cache_get(self, session_id: str) -> Optional[AgentState]:
+        """Return a private copy of a pending or cached session, or None on miss/expiry."""
+        with self._cache_lock:
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                return pending.clone()
+            item = self._cache.get(session_id)
+            if item is None:
+                return None
+            expires_at, state = item
+            if time.time() > expires_at:
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+        # Callers mutate the state they get back; never hand out the cached instance
+        return state.clone()
+
+    def _cache_put(self, session_id: str, snapshot: AgentState):
+        """Cache a state the caller no longer mutates (pass a copy)."""
+        if self._cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[session_id] = (time.time() + self._cache_ttl, snapshot)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
     def rename_session(self, session_id: str, new_title: str):
         """Rename a session in the index."""
+        self.flush()
         try:
-            index = self._load_index()
-            if session_id in index:
-                index[session_id]["title"] = new_title[:50]
-                self._save_index(index)
-                
+            if self.backend.rename(session_id, new_title):
                 # Also update the actual session file if possible, but index is source of truth for lists
                 try:
                     state = self.load_session(session_id)
@@ -83,75 +417,94 @@ class SessionService:
             logger.error(f"Failed to rename session {session_id}: {e}")
             raise
 
-    def _update_index(self, session_id: str, state: AgentState):
-        """Update a single entry in the index."""
+    def _write(self, session_id: str, state: AgentState):
         try:
-            index = self._load_index()
-            index[session_id] = {
-                "id": session_id,
-                "work_id": state.work_id,
-                "title": (state.user_message or "New Session")[:50],
-                "timestamp": time.time()
-            }
-            self._save_index(index)
-        except Exception as e:
-            logger.error(f"Failed to update index for {session_id}: {e}")
-
-    def save_session(self, session_id: str, state: AgentState):
-        """Save session state to disk."""
-        try:
-            path = self._get_path(session_id)
-            with open(path, 'w') as f:
-                # Pydantic v1/v2 compatibility: try usage
-                if hasattr(state, 'model_dump_json'):
-                    f.write(state.model_dump_json())
-                else:
-                    f.write(state.json())
-            
-            # Update index
-            self._update_index(session_id, state)
-            
+            # Store the plain field dict (not the model) so saved sessions survive model changes
+            self.backend.save(session_id, state.to_dict())
         except Exception as e:
             logger.error(f"Failed to save session {session_id}: {e}")
             raise
 
+    def save_session(self, session_id: str, state: AgentState):
+        """
+        Save session state. While the background flusher runs, the write is
+        coalesced with other saves of the same session; otherwise (or when the
+        backend is shared between workers) it is written through.
+        """
+        snapshot = state.clone()
+        self._cache_put(session_id, snapshot)
+
+        if self._flusher_task is None or self.backend.shared:
+            with self._flush_lock:
+                self._write(session_id, snapshot)
+            return
+
+        with self._cache_lock:
+            self._pending[session_id] = snapshot
+
+    def flush(self):
+        """Persist all pending session writes."""
+        with self._flush_lock:
+            with self._cache_lock:
+                pending, self._pending = self._pending, {}
+            for session_id, state in pending.items():
+                try:
+                    self._write(session_id, state)
+                except Exception:
+                    pass  # already logged
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            if self._pending:
+                await asyncio.to_thread(self.flush)
+
+    def start_flusher(self):
+        """Start debounced background writes (call from a running event loop)."""
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.get_running_loop().create_task(self._flusher())
+
+    async def stop_flusher(self):
+        """Stop the flusher and write anything still pending."""
+        task, self._flusher_task = self._flusher_task, None
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        self.flush()
+
     def load_session(self, session_id: str) -> Optional[AgentState]:
-        """Load session state from disk."""
-        path = self._get_path(session_id)
-        if not os.path.exists(path):
-            return None
+        """Load session state (memory cache first, then the backend)."""
+        cached = self._cache_get(session_id)
+        if cached is not None:
+            return cached
+
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
-            return AgentState(**data)
+            data = self.backend.load(session_id)
+            if data is None:
+                return None
+            state = AgentState.from_dict(data)
+            self._cache_put(session_id, state.clone())
+            return state
         except Exception as e:
             logger.error(f"Failed to load session {session_id}: {e}")
             return None
 
     def delete_session(self, session_id: str):
         """Delete session file."""
-        path = self._get_path(session_id)
-        if os.path.exists(path):
-            os.remove(path)
-        
-        # Remove from index
-        try:
-            index = self._load_index()
-            if session_id in index:
-                del index[session_id]
-                self._save_index(index)
-        except Exception as e:
-            logger.error(f"Failed to update index after delete {session_id}: {e}")
+        with self._flush_lock:
+            with self._cache_lock:
+                self._cache.pop(session_id, None)
+                self._pending.pop(session_id, None)
+            self.backend.delete(session_id)
 
     def list_sessions(self) -> List[Dict]:
         """List all available sessions with metadata."""
-        # Check if index exists, if not rebuild
-        if not os.path.exists(self.index_path):
-            self._rebuild_index()
-            
-        index = self._load_index()
-        sessions = list(index.values())
-        
+        # Pending saves are not in the index yet
+        self.flush()
+
+        sessions = self.backend.list_index()
+
         # Sort by timestamp desc
         sessions.sort(key=lambda x: x['timestamp'], reverse=True)
         return sessions
@@ -0,0 +1,20 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.services.agent_service import agent_service
+
+
+@pytest.mark.parametrize("data", [
+    b"a,b\n1,\n2,\n",
+    b"a,b\nNone,1\nx,2\n",
+    b"a,b\n1.5,NA\n2,null\n",
+    b"a\n9223372036854775808\n1\n",
+    b"a\n-9223372036854775809\n1\n",
+    b"a\n1\n2\n",
+])
+def test_read_csv_matches_pandas(data):
+    df = agent_service._read_csv(data)
+    expected = pd.read_csv(io.BytesIO(data))
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from app.services.execution_service import exec_code, validate_code
+
+
+@pytest.mark.parametrize("code", [
+    "df['p'] = random._os.getcwd()",
+    "df['p'] = str(random._os.listdir('/'))",
+    "x = collections._sys.modules",
+    "x = string._re",
+    "x = re._compiler",
+    "x = df.__class__",
+])
+def test_validate_code_rejects_private_attributes(code):
+    is_valid, error = validate_code(code)
+    assert not is_valid
+    assert "attributes not allowed" in error
+
+
+def test_exec_code_does_not_run_private_module_alias():
+    df = pd.DataFrame({"a": [1, 2]})
+    result, error, _ = exec_code("df['p'] = random._os.getcwd()", df)
+    assert error is not None
+    assert result is df
+
+
+def test_exec_code_runs_plain_script():
+    df = pd.DataFrame({"a": [1, 2]})
+    result, error, _ = exec_code("df['b'] = df['a'] * 2", df)
+    assert error is None
+    assert result["b"].tolist() == [2, 4]